@@ -5,67 +5,231 @@ for evaluation. This becomes complicated when we allow partial matching between
 arguments.
 
 The danger is that if the relations are anomalous, the search space would become 
-huge. If the program does not terminate within minutes, we should look at the 
-the output and make sure that the arg spans are reasonable. 
+huge. alignment_complexity.py estimates the size of the search space for each
+document before aligning and lists the relations responsible. Documents that
+would blow up can be aligned with a greedy bounded search instead by passing
+their DocIDs as bounded_doc_ids.
 """
 import json
 from collections import defaultdict
 import numpy as np
 
+from profiler import PROFILER
+from span import relation_spans, token_span
 from threading_timer_decorator_exit import exit_after
 
-@exit_after(120)
-def align_relations(gold_list, predicted_list, partial_match_cutoff):
+ALIGNMENT_KINDS = ['arg1', 'arg2', 'relation']
+
+def align_relations(gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids=None):
     """Aligning two lists of relations
 
     Input:
         gold_list : a list of ground truth relations
         predicted_list : a list of predicted relations
+        bounded_doc_ids : DocIDs to align greedily instead of with the exact search
 
     Returns:
-        A list of alignments between gold and predicted relations
+        A tuple of the Arg1, Arg2, and relation alignments, each a list of
+        (gold relation, predicted relation) pairs with None for no relation
     """
-    for g_relation in gold_list:
-        g_relation['Arg1']['TokenIndexSet'] = \
-                set([x[2] for x in g_relation['Arg1']['TokenList']])
-        g_relation['Arg2']['TokenIndexSet'] = \
-                set([x[2] for x in g_relation['Arg2']['TokenList']])
-    for p_relation in predicted_list:
-        p_relation['Arg1']['TokenIndexSet'] = \
-                set(p_relation['Arg1']['TokenList'])
-        p_relation['Arg2']['TokenIndexSet'] = \
-                set(p_relation['Arg2']['TokenList'])
-
-    doc_id_to_gold_list = _separate_by_doc_id(gold_list)
-    doc_id_to_predicted_list = _separate_by_doc_id(predicted_list)
+    index_alignments = align_relation_indices(
+        gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids)
+    return tuple(index_to_relation_alignment(gold_list, predicted_list, x)
+        for x in index_alignments)
+
+class IndexAlignment(object):
+    """An alignment as parallel NumPy arrays
+
+    gold_indices and predicted_indices are positions in gold_list and
+    predicted_list, with -1 where a relation is aligned to nothing. For each
+    argument key ('Arg1', 'Arg2') gold_sizes[key], predicted_sizes[key], and
+    shared[key] count the tokens of the gold argument, of the predicted
+    argument, and of both, with 0 for a missing side. gold_spans and
+    predicted_spans are the span.relation_spans of the lists, if known.
+    """
+
+    def __init__(self, gold_list, predicted_list, index_pairs, gold_spans=None,
+            predicted_spans=None):
+        self.gold_list = gold_list
+        self.predicted_list = predicted_list
+        if gold_spans is None:
+            gold_spans = relation_spans(gold_list)
+        if predicted_spans is None:
+            predicted_spans = relation_spans(predicted_list)
+        pairs = np.array(index_pairs, dtype=np.int64).reshape((len(index_pairs), 2))
+        self.gold_indices = pairs[:, 0]
+        self.predicted_indices = pairs[:, 1]
+        self.has_gold = self.gold_indices != -1
+        self.has_predicted = self.predicted_indices != -1
+        self.gold_sizes = {}
+        self.predicted_sizes = {}
+        self.shared = {}
+        for position, key in enumerate(['Arg1', 'Arg2']):
+            self._count_tokens(key, [x[position] for x in gold_spans],
+                [x[position] for x in predicted_spans])
+
+    def __len__(self):
+        return len(self.gold_indices)
+
+    def _count_tokens(self, key, gold_arg_spans, predicted_arg_spans):
+        gold_sizes = np.zeros(len(self), dtype=np.int64)
+        predicted_sizes = np.zeros(len(self), dtype=np.int64)
+        shared = np.zeros(len(self), dtype=np.int64)
+        for k, (gi, pi) in enumerate(zip(self.gold_indices, self.predicted_indices)):
+            g_span = gold_arg_spans[gi] if gi != -1 else None
+            p_span = predicted_arg_spans[pi] if pi != -1 else None
+            if g_span is not None:
+                gold_sizes[k] = g_span.size
+            if p_span is not None:
+                predicted_sizes[k] = p_span.size
+            if g_span is not None and p_span is not None:
+                shared[k] = g_span.intersection_size(p_span)
+        self.gold_sizes[key] = gold_sizes
+        self.predicted_sizes[key] = predicted_sizes
+        self.shared[key] = shared
+
+    def arg_f1(self, position):
+        """The token F1 of the Arg1 or Arg2 of every pair, as compute_f1_span"""
+        assert position == 1 or position == 2
+        key = 'Arg%s' % position
+        correct = self.shared[key].astype(float)
+        f1 = np.zeros(len(self))
+        nonzero = correct > 0
+        precision = correct[nonzero] / self.predicted_sizes[key][nonzero]
+        recall = correct[nonzero] / self.gold_sizes[key][nonzero]
+        f1[nonzero] = 2 * (precision * recall) / (precision + recall)
+        return f1
+
+    def doc_ids(self):
+        """The DocID of every pair"""
+        return [(self.gold_list[gi] if gi != -1 else self.predicted_list[pi])['DocID']
+            for gi, pi in zip(self.gold_indices, self.predicted_indices)]
+
+    def senses(self, indices, relation_list):
+        """The first sense of the relation at each of indices, None for -1"""
+        return [relation_list[i]['Sense'][0] if i != -1 else None for i in indices]
+
+    def relation_pairs(self):
+        """The alignment as a list of (gold relation, predicted relation)"""
+        return index_to_relation_alignment(self.gold_list, self.predicted_list,
+            zip(self.gold_indices, self.predicted_indices))
+
+def align_relation_arrays(gold_list, predicted_list, partial_match_cutoff,
+        bounded_doc_ids=None, alignment_cache=None, gold_spans=None, predicted_spans=None):
+    """Align two lists of relations into IndexAlignments
+
+    An alignment_cache.AlignmentCache reuses the alignments of earlier runs.
+    gold_spans and predicted_spans are the span.relation_spans of the lists;
+    they are computed here unless they are given.
+
+    Returns:
+        A tuple of the Arg1, Arg2, and relation IndexAlignment
+    """
+    if gold_spans is None:
+        gold_spans = relation_spans(gold_list)
+    if predicted_spans is None:
+        predicted_spans = relation_spans(predicted_list)
+    if alignment_cache is not None:
+        index_alignments = alignment_cache.align(gold_list, predicted_list,
+            partial_match_cutoff, bounded_doc_ids, gold_spans, predicted_spans)
+    else:
+        index_alignments = align_relation_indices(gold_list, predicted_list,
+            partial_match_cutoff, bounded_doc_ids, gold_spans, predicted_spans)
+    return tuple(IndexAlignment(gold_list, predicted_list, x, gold_spans, predicted_spans)
+        for x in index_alignments)
+
+@exit_after(120)
+def align_relation_indices(gold_list, predicted_list, partial_match_cutoff,
+        bounded_doc_ids=None, gold_spans=None, predicted_spans=None):
+    """Align two lists of relations by their positions in the lists
+
+    The relations are compared by their argument spans, gold_spans and
+    predicted_spans (see span.relation_spans), which are computed here
+    unless they are given.
+
+    Returns:
+        A tuple of the Arg1, Arg2, and relation alignments (in the order of
+        ALIGNMENT_KINDS), each a list of (gold index, predicted index) pairs
+        with -1 for no relation
+    """
+    if gold_spans is None:
+        gold_spans = relation_spans(gold_list)
+    if predicted_spans is None:
+        predicted_spans = relation_spans(predicted_list)
+
+    doc_id_to_gold_indices = _indices_by_doc_id(gold_list)
+    doc_id_to_predicted_indices = _indices_by_doc_id(predicted_list)
     all_doc_id = set(
-        doc_id_to_gold_list.keys() + doc_id_to_predicted_list.keys())
+        doc_id_to_gold_indices.keys() + doc_id_to_predicted_indices.keys())
     relation_alignment = []
     arg1_alignment = []
     arg2_alignment = []
+    if bounded_doc_ids is None:
+        bounded_doc_ids = set()
     for doc_id in all_doc_id:
-        doc_gold_list = doc_id_to_gold_list[doc_id]
-        doc_predicted_list = doc_id_to_predicted_list[doc_id]
-
-        new_relation_alignment = _align(
-            doc_gold_list, doc_predicted_list, rel_alignment_score, partial_match_cutoff)
-        new_arg1_alignment = _align(
-            doc_gold_list, doc_predicted_list, arg1_alignment_score, partial_match_cutoff)
-        new_arg2_alignment = _align(
-            doc_gold_list, doc_predicted_list, arg2_alignment_score, partial_match_cutoff)
-        relation_alignment.extend(new_relation_alignment)
-        arg1_alignment.extend(new_arg1_alignment)
-        arg2_alignment.extend(new_arg2_alignment)
+        gold_indices = doc_id_to_gold_indices[doc_id]
+        predicted_indices = doc_id_to_predicted_indices[doc_id]
+        doc_gold_spans = [gold_spans[i] for i in gold_indices]
+        doc_predicted_spans = [predicted_spans[i] for i in predicted_indices]
+        if doc_id in bounded_doc_ids:
+            align_fn = _greedy_align
+            PROFILER.count('documents aligned greedily')
+        else:
+            align_fn = _align
+
+        for alignment, alignment_score_fn in [
+                (relation_alignment, _rel_spans_score),
+                (arg1_alignment, _arg1_spans_score),
+                (arg2_alignment, _arg2_spans_score)]:
+            index_alignment = align_fn(
+                doc_gold_spans, doc_predicted_spans, alignment_score_fn, partial_match_cutoff)
+            alignment.extend((gold_indices[i] if i != -1 else -1,
+                predicted_indices[j] if j != -1 else -1) for i, j in index_alignment)
+    PROFILER.count('documents aligned', len(all_doc_id))
 
     return arg1_alignment, arg2_alignment, relation_alignment
 
 def _align(gold_list, predicted_list, alignment_score_fn, partial_match_cutoff):
     """Align the gold standard and the predicted discourse relations in the same doc
+
+    The relations can be relation dictionaries or their (Arg1 span, Arg2 span)
+    pairs, as long as alignment_score_fn takes them.
+
+    Returns:
+        A list of (gold index, predicted index) pairs within the doc
     """
     rel_score_matrix, rel_adjacency = compute_score_matrix(
         gold_list, predicted_list, alignment_score_fn, partial_match_cutoff)
     _, index_alignment = _recurs_align_relations(
         0, set(), len(predicted_list), rel_score_matrix, rel_adjacency, partial_match_cutoff)
+    return index_alignment
+
+def _greedy_align(gold_list, predicted_list, alignment_score_fn, partial_match_cutoff):
+    """Align the relations in the same doc by taking the best scoring pairs first
+
+    This does not always find the best alignment, but it takes
+    O(E log E) time for E candidate pairs no matter how the spans overlap.
+    """
+    score_matrix, _ = compute_score_matrix(
+        gold_list, predicted_list, alignment_score_fn, partial_match_cutoff)
+    candidates = sorted(((score, gi, pi) for gi in score_matrix
+        for pi, score in score_matrix[gi].items()), key=lambda x: -x[0])
+    gi_used_set = set()
+    pi_used_set = set()
+    index_alignment = []
+    for _, gi, pi in candidates:
+        if gi not in gi_used_set and pi not in pi_used_set:
+            gi_used_set.add(gi)
+            pi_used_set.add(pi)
+            index_alignment.append((gi, pi))
+    index_alignment.extend((gi, -1)
+        for gi in xrange(len(gold_list)) if gi not in gi_used_set)
+    index_alignment.extend((-1, pi)
+        for pi in xrange(len(predicted_list)) if pi not in pi_used_set)
+    return index_alignment
+
+def index_to_relation_alignment(gold_list, predicted_list, index_alignment):
+    """Turn (gold index, predicted index) pairs into pairs of relations"""
     rel_alignment = []
     for i, j in index_alignment:
         g_relation = gold_list[i] if i != -1 else None
@@ -81,6 +245,7 @@ def compute_score_matrix(gold_list, predicted_list, alignment_score_fn, partial_
     """
     score_matrix = {}
     adjacency = np.zeros((len(gold_list), len(predicted_list)))
+    PROFILER.count('pairs compared', len(gold_list) * len(predicted_list))
     for i, g_relation in enumerate(gold_list):
         score_matrix[i] = {}
         for j, p_relation in enumerate(predicted_list):
@@ -91,6 +256,7 @@ def compute_score_matrix(gold_list, predicted_list, alignment_score_fn, partial_
     return score_matrix, adjacency
 
 def _recurs_align_relations(gi, pi_used_set, num_predicted, score_matrix, adjacency, partial_match_cutoff):
+    PROFILER.count('alignment search nodes visited')
     if gi == len(score_matrix):
         alignment = [(-1, pi)
             for pi in xrange(num_predicted) if pi not in pi_used_set]
@@ -126,55 +292,46 @@ def _recurs_align_relations(gi, pi_used_set, num_predicted, score_matrix, adjace
 
 
 def rel_alignment_score(g_relation, p_relation):
-    arg1_overlap = is_overlap(g_relation['Arg1'], p_relation['Arg1'])
-    arg2_overlap = is_overlap(g_relation['Arg2'], p_relation['Arg2'])
-    if arg1_overlap and arg2_overlap:
-        arg1_f1 = _arg_pos_alignment_score(g_relation, p_relation, 1)
-        arg2_f1 = _arg_pos_alignment_score(g_relation, p_relation, 2)
+    return _rel_spans_score(relation_spans([g_relation])[0], relation_spans([p_relation])[0])
+
+def arg1_alignment_score(g_relation, p_relation):
+    return _arg_spans_score(token_span(g_relation['Arg1']), token_span(p_relation['Arg1']))
+
+def arg2_alignment_score(g_relation, p_relation):
+    return _arg_spans_score(token_span(g_relation['Arg2']), token_span(p_relation['Arg2']))
+
+def _rel_spans_score(g_spans, p_spans):
+    """rel_alignment_score of two (Arg1 span, Arg2 span) pairs"""
+    if spans_overlap(g_spans[0], p_spans[0]) and spans_overlap(g_spans[1], p_spans[1]):
+        arg1_f1 = compute_f1_span(g_spans[0], p_spans[0])
+        arg2_f1 = compute_f1_span(g_spans[1], p_spans[1])
         return (arg1_f1 + arg2_f1) / 2
     else:
         return 0.0
 
-def arg1_alignment_score(g_relation, p_relation):
-    arg1_overlap = is_overlap(g_relation['Arg1'], p_relation['Arg1'])
-    if arg1_overlap:
-        return _arg_pos_alignment_score(g_relation, p_relation, 1)
-    else: 
-        return 0.0
+def _arg1_spans_score(g_spans, p_spans):
+    return _arg_spans_score(g_spans[0], p_spans[0])
 
-def arg2_alignment_score(g_relation, p_relation):
-    arg2_overlap = is_overlap(g_relation['Arg2'], p_relation['Arg2'])
-    if arg2_overlap:
-        return _arg_pos_alignment_score(g_relation, p_relation, 2)
+def _arg2_spans_score(g_spans, p_spans):
+    return _arg_spans_score(g_spans[1], p_spans[1])
+
+def _arg_spans_score(g_span, p_span):
+    if spans_overlap(g_span, p_span):
+        return compute_f1_span(g_span, p_span)
     else:
         return 0.0
 
-def _arg_pos_alignment_score(g_relation, p_relation, arg_pos):
-    assert arg_pos == 1 or arg_pos == 2
-    key = 'Arg%s' % arg_pos
-    arg_f1 = compute_f1_span(
-        g_relation[key]['TokenIndexSet'],
-        p_relation[key]['TokenIndexSet'])
-    return arg_f1
-
-def save_alignment(relation_pairs):
-    """Save alignment for inspection"""
-    f = open('relation_alignment.json', 'w')
-    for pair in relation_pairs:
-        new_pair = []
-        new_pair.append(pair[0].deepcopy())
-        new_pair.append(pair[1].deepcopy())
-        if pair[0] is None:
-            new_pair[0] = {}
-        else:
-            del new_pair[0]['Arg1']['TokenIndexSet']
-            del new_pair[0]['Arg2']['TokenIndexSet']
-        if pair[1] is None:
-            new_pair[1] = {}
-        else:
-            del new_pair[1]['Arg1']['TokenIndexSet']
-            del new_pair[1]['Arg2']['TokenIndexSet']
-        f.write(json.dumps(new_pair) + '\n')
+def relation_for_json(relation):
+    """A relation as written to the alignment files, {} for no relation"""
+    if relation is None:
+        return {}
+    return relation
+
+def save_alignment(relation_pairs, file_name='relation_alignment.json'):
+    """Save alignment for inspection, one [gold, predicted] pair per line"""
+    f = open(file_name, 'w')
+    for g_relation, p_relation in relation_pairs:
+        f.write(json.dumps([relation_for_json(g_relation), relation_for_json(p_relation)]) + '\n')
     f.close()
 
 def is_overlap(g_arg, p_arg):
@@ -185,24 +342,28 @@ def is_overlap(g_arg, p_arg):
     """
     if len(p_arg['TokenList']) == 0:
         return False
-    return (g_arg['TokenList'][-1][2] > p_arg['TokenList'][0] and \
-            g_arg['TokenList'][0][2] <= p_arg['TokenList'][0]) or \
-        (p_arg['TokenList'][-1] > g_arg['TokenList'][0][2] and \
-            p_arg['TokenList'][0] <= g_arg['TokenList'][0][2])
+    return spans_overlap(token_span(g_arg), token_span(p_arg))
+
+def spans_overlap(g_span, p_span):
+    """is_overlap of two span.Span"""
+    if p_span.size == 0:
+        return False
+    return (g_span.last > p_span.first and g_span.first <= p_span.first) or \
+        (p_span.last > g_span.first and p_span.first <= g_span.first)
 
 
-def compute_f1_span(g_index_set, p_index_set):
-    """Compute F1 score for a given pair of token list"""
-    correct = float(len(g_index_set.intersection(p_index_set)))
+def compute_f1_span(g_span, p_span):
+    """Compute F1 score for a given pair of span.Span"""
+    correct = float(g_span.intersection_size(p_span))
     if correct == 0.0:
         return 0.0
-    precision = correct / len(p_index_set)
-    recall = correct / len(g_index_set)
+    precision = correct / p_span.size
+    recall = correct / g_span.size
     return 2 * (precision * recall) / (precision + recall)
 
-def _separate_by_doc_id(relation_list):
-    """Use a dictionary to sort out the relation list by the docID"""
-    doc_id_to_relation_list = defaultdict(list)
-    for relation in relation_list:
-        doc_id_to_relation_list[relation['DocID']].append(relation)
-    return doc_id_to_relation_list
+def _indices_by_doc_id(relation_list):
+    """Use a dictionary to sort out the positions in the relation list by the docID"""
+    doc_id_to_indices = defaultdict(list)
+    for i, relation in enumerate(relation_list):
+        doc_id_to_indices[relation['DocID']].append(i)
+    return doc_id_to_indices
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Persistent cache of relation alignments
+
+Aligning the relations is the slowest part of the partial scorer, and
+running partial_scorer.py again on the same gold standard and system output
+redoes the whole search. The alignments are saved here as arrays of
+(gold index, predicted index) pairs in NumPy's .npy format, one file per
+alignment kind (see aligner.ALIGNMENT_KINDS). The file name is a hash of
+
+    the content of the gold relations and of the predicted relations
+    the partial match cutoff
+    the alignment kind
+    the documents aligned greedily (bounded_doc_ids)
+
+so a changed file, or a subset of it such as the explicit relations only,
+never picks up an alignment that does not belong to it. Only what the
+alignment depends on is hashed: the DocID and the Arg1 and Arg2 tokens of
+every relation in list order. The cache directory can be emptied at any time.
+
+The alignments can be written out as JSON lines for inspection:
+
+python alignment_cache.py gold/relations.json output.json alignment.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from profiler import PROFILER
+from span import relation_spans
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'conll16st', 'alignments')
+
+def _numpy():
+    """NumPy, imported on first use"""
+    import numpy
+    return numpy
+
+def _aligner():
+    """The aligner module, imported on first use as it loads NumPy"""
+    import aligner
+    return aligner
+
+def relation_list_hash(relation_list, spans=None):
+    """SHA-1 of the DocIDs and the Arg1 and Arg2 tokens of the relations
+
+    spans are the span.relation_spans of relation_list, if known.
+    """
+    if spans is None:
+        spans = relation_spans(relation_list)
+    digest = hashlib.sha1()
+    for relation, (arg1_span, arg2_span) in zip(relation_list, spans):
+        digest.update('%s\t%r\t%r\n' % (json.dumps(relation['DocID']),
+            arg1_span.runs, arg2_span.runs))
+    return digest.hexdigest()
+
+
+class AlignmentCache(object):
+    """Index alignments saved in a directory by the content they were computed from"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def keys(self, gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids=None,
+            gold_spans=None, predicted_spans=None):
+        """The cache key of each alignment kind, in the order of aligner.ALIGNMENT_KINDS"""
+        base = '%s %s %s %r %s' % (CACHE_VERSION, relation_list_hash(gold_list, gold_spans),
+            relation_list_hash(predicted_list, predicted_spans), float(partial_match_cutoff),
+            json.dumps(sorted(bounded_doc_ids or [])))
+        return [hashlib.sha1('%s %s' % (base, kind)).hexdigest() for kind in _aligner().ALIGNMENT_KINDS]
+
+    def file_name(self, key):
+        return os.path.join(self.cache_dir, '%s.npy' % key)
+
+    def load(self, key, num_gold, num_predicted):
+        """The saved index alignment as an array of (gold index, predicted index)
+        rows, or None if there is none or it does not fit lists of these lengths"""
+        numpy = _numpy()
+        try:
+            pairs = numpy.load(self.file_name(key))
+        except (IOError, ValueError):
+            return None
+        if pairs.ndim != 2 or pairs.shape[1] != 2:
+            return None
+        if len(pairs) > 0 and (pairs.min() < -1 or pairs[:, 0].max() >= num_gold or
+                pairs[:, 1].max() >= num_predicted):
+            return None
+        return pairs
+
+    def save(self, key, index_alignment):
+        """Save an index alignment. A cache that cannot be written is not an error."""
+        numpy = _numpy()
+        pairs = numpy.array(index_alignment, dtype=numpy.int32).reshape((len(index_alignment), 2))
+        file_name = self.file_name(key)
+        tmp_file = '%s.%s.tmp' % (file_name, os.getpid())
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            f = open(tmp_file, 'wb')
+            numpy.save(f, pairs)
+            f.close()
+            os.rename(tmp_file, file_name)
+        except (IOError, OSError):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def align(self, gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids=None,
+            gold_spans=None, predicted_spans=None):
+        """aligner.align_relation_indices, reusing the alignments of earlier runs
+
+        A reused alignment is an array of (gold index, predicted index) rows
+        instead of a list of pairs.
+        """
+        aligner = _aligner()
+        if gold_spans is None:
+            gold_spans = relation_spans(gold_list)
+        if predicted_spans is None:
+            predicted_spans = relation_spans(predicted_list)
+        keys = self.keys(gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids,
+            gold_spans, predicted_spans)
+        index_alignments = [self.load(key, len(gold_list), len(predicted_list)) for key in keys]
+        if all(x is not None for x in index_alignments):
+            PROFILER.count('alignments loaded from the cache', len(keys))
+            return tuple(index_alignments)
+        index_alignments = aligner.align_relation_indices(
+            gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids,
+            gold_spans, predicted_spans)
+        for key, index_alignment in zip(keys, index_alignments):
+            self.save(key, index_alignment)
+        return index_alignments
+
+def write_alignment_jsonl(gold_list, predicted_list, index_alignments, f):
+    """Write one JSON line per aligned pair, one alignment kind after the other"""
+    aligner = _aligner()
+    for kind, index_alignment in zip(aligner.ALIGNMENT_KINDS, index_alignments):
+        for gi, pi in index_alignment:
+            gi, pi = int(gi), int(pi)
+            g_relation = gold_list[gi] if gi != -1 else None
+            p_relation = predicted_list[pi] if pi != -1 else None
+            f.write(json.dumps({
+                'kind': kind,
+                'DocID': (g_relation or p_relation)['DocID'],
+                'gold_index': gi,
+                'predicted_index': pi,
+                'gold': aligner.relation_for_json(g_relation) if g_relation is not None else None,
+                'predicted': aligner.relation_for_json(p_relation) if p_relation is not None else None,
+                }) + '\n')
+
+def main():
+    from loader import load_gold_and_predicted
+    parser = argparse.ArgumentParser(
+        description='Write the alignment of the gold and predicted relations as JSON lines')
+    parser.add_argument('gold', help='Gold standard file')
+    parser.add_argument('predicted', help='System output file')
+    parser.add_argument('output', help='JSON lines file to write')
+    parser.add_argument('--cutoff', help='Cutoff value for partial matching', default=0.7, type=float)
+    parser.add_argument('--alignment-cache', default=DEFAULT_CACHE_DIR, metavar='DIR',
+        help='Directory of saved alignments (default: %(default)s)')
+    args = parser.parse_args()
+
+    gold_list, predicted_list = load_gold_and_predicted(args.gold, args.predicted)
+    index_alignments = AlignmentCache(args.alignment_cache).align(
+        gold_list, predicted_list, args.cutoff)
+    f = open(args.output, 'w')
+    write_alignment_jsonl(gold_list, predicted_list, index_alignments, f)
+    f.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Alignment complexity estimator
+
+The aligner searches over all one-to-one assignments between the gold and the
+predicted relations of a document whose arguments overlap. Before running the
+search, we can look at the overlap structure alone and tell which documents
+will blow up. For every document and every kind of alignment (Arg1, Arg2,
+relation), we build the bipartite graph that connects a gold relation to the
+predicted relations it overlaps with, and report
+
+    the sizes of its connected components
+    the degree distribution of the gold relations
+    an upper bound on the number of search states, which is the product of
+    (degree + 1) over the gold relations of the document
+
+The documents are ranked by the bound, and the relations in the worst
+component are listed so that they can be inspected.
+
+python alignment_complexity.py tutorial/conll16st-en-01-12-16-trial/relations.json tutorial/output.json
+"""
+import argparse
+import json
+import math
+from collections import Counter, defaultdict
+
+import aligner
+from loader import load_gold_and_predicted
+
+ALIGNMENT_KINDS = [
+    ('arg1', ['Arg1']),
+    ('arg2', ['Arg2']),
+    ('relation', ['Arg1', 'Arg2']),
+    ]
+
+def _overlaps(g_relation, p_relation, arg_keys):
+    for key in arg_keys:
+        if len(g_relation[key]['TokenList']) == 0 or \
+                not aligner.is_overlap(g_relation[key], p_relation[key]):
+            return False
+    return True
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def compute_graph_statistics(gold_list, predicted_list, arg_keys):
+    """Statistics of the candidate graph of one document
+
+    Returns:
+        A dictionary of statistics. Components are given as lists of
+        gold relation indices and predicted relation indices.
+    """
+    adjacency = [[pi for pi, p_relation in enumerate(predicted_list)
+        if _overlaps(g_relation, p_relation, arg_keys)]
+        for g_relation in gold_list]
+    num_gold = len(gold_list)
+    parent = range(num_gold + len(predicted_list))
+    for gi, neighbors in enumerate(adjacency):
+        for pi in neighbors:
+            root1 = _find(parent, gi)
+            root2 = _find(parent, num_gold + pi)
+            if root1 != root2:
+                parent[root1] = root2
+    components = {}
+    for node in xrange(len(parent)):
+        components.setdefault(_find(parent, node), []).append(node)
+
+    component_list = []
+    for nodes in components.values():
+        gold_indices = [x for x in nodes if x < num_gold]
+        predicted_indices = [x - num_gold for x in nodes if x >= num_gold]
+        log10_states = sum(math.log10(len(adjacency[gi]) + 1) for gi in gold_indices)
+        component_list.append({'gold': gold_indices, 'predicted': predicted_indices,
+            'log10_search_states': log10_states})
+    component_list.sort(key=lambda x: -x['log10_search_states'])
+    degrees = [len(x) for x in adjacency]
+    return {
+        'num_edges': sum(degrees),
+        'max_degree': max(degrees) if degrees else 0,
+        'degree_histogram': dict(Counter(degrees)),
+        'component_sizes': [len(x['gold']) + len(x['predicted']) for x in component_list],
+        'components': component_list,
+        'log10_search_states': sum(x['log10_search_states'] for x in component_list),
+        }
+
+def _separate_by_doc_id(relation_list):
+    """Group (index, relation) pairs by the DocID"""
+    doc_id_to_relation_list = defaultdict(list)
+    for i, relation in enumerate(relation_list):
+        doc_id_to_relation_list[relation['DocID']].append((i, relation))
+    return doc_id_to_relation_list
+
+def _relation_id(relation, index):
+    return relation.get('ID', index)
+
+def estimate_alignment_complexity(gold_list, predicted_list):
+    """Estimate how hard each document is to align
+
+    Returns:
+        A list of dictionaries, one per document, with the hardest documents
+        first. log10_search_states is the bound for the hardest kind of
+        alignment, and offending_gold/offending_predicted identify the
+        relations in its worst component (gold relations by ID, predicted
+        relations by their position in predicted_list).
+    """
+    doc_id_to_gold_list = _separate_by_doc_id(gold_list)
+    doc_id_to_predicted_list = _separate_by_doc_id(predicted_list)
+    all_doc_id = set(doc_id_to_gold_list.keys() + doc_id_to_predicted_list.keys())
+    doc_complexities = []
+    for doc_id in all_doc_id:
+        doc_gold = doc_id_to_gold_list[doc_id]
+        doc_predicted = doc_id_to_predicted_list[doc_id]
+        gold_relations = [x for _, x in doc_gold]
+        predicted_relations = [x for _, x in doc_predicted]
+        complexity = {'DocID': doc_id, 'num_gold': len(doc_gold),
+            'num_predicted': len(doc_predicted), 'kinds': {}}
+        for kind, arg_keys in ALIGNMENT_KINDS:
+            complexity['kinds'][kind] = compute_graph_statistics(
+                gold_relations, predicted_relations, arg_keys)
+        worst_kind = max(complexity['kinds'],
+            key=lambda x: complexity['kinds'][x]['log10_search_states'])
+        worst = complexity['kinds'][worst_kind]
+        complexity['worst_kind'] = worst_kind
+        complexity['log10_search_states'] = worst['log10_search_states']
+        if worst['components']:
+            component = worst['components'][0]
+            complexity['offending_gold'] = [
+                _relation_id(doc_gold[gi][1], doc_gold[gi][0]) for gi in component['gold']]
+            complexity['offending_predicted'] = [
+                doc_predicted[pi][0] for pi in component['predicted']]
+        else:
+            complexity['offending_gold'] = []
+            complexity['offending_predicted'] = []
+        doc_complexities.append(complexity)
+    doc_complexities.sort(key=lambda x: -x['log10_search_states'])
+    return doc_complexities
+
+def select_bounded_doc_ids(doc_complexities, max_search_states):
+    """DocIDs whose search space bound exceeds max_search_states
+
+    These can be given to aligner.align_relations as bounded_doc_ids.
+    """
+    max_log10_states = math.log10(max_search_states)
+    return set(x['DocID'] for x in doc_complexities
+        if x['log10_search_states'] > max_log10_states)
+
+def print_report(doc_complexities, top):
+    print '%-15s %6s %6s %13s %9s %10s %s' % ('DocID', '#gold', '#pred',
+        'log10(states)', 'kind', 'max degree', 'largest components')
+    for complexity in doc_complexities[:top]:
+        worst = complexity['kinds'][complexity['worst_kind']]
+        print '%-15s %6s %6s %13.2f %9s %10s %s' % (complexity['DocID'],
+            complexity['num_gold'], complexity['num_predicted'],
+            complexity['log10_search_states'], complexity['worst_kind'],
+            worst['max_degree'], worst['component_sizes'][:5])
+        print '\tgold relation IDs %s' % complexity['offending_gold']
+        print '\tpredicted relation lines %s' % \
+            [x + 1 for x in complexity['offending_predicted']]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rank the documents by how hard they are to align')
+    parser.add_argument('gold', help='Gold standard file')
+    parser.add_argument('predicted', help='System output file')
+    parser.add_argument('--top', default=10, type=int,
+        help='Number of documents to report')
+    parser.add_argument('--json', help='Write the full report to this file as JSON')
+    args = parser.parse_args()
+    gold_list, predicted_list = load_gold_and_predicted(args.gold, args.predicted)
+    doc_complexities = estimate_alignment_complexity(gold_list, predicted_list)
+    print_report(doc_complexities, args.top)
+    if args.json is not None:
+        json.dump(doc_complexities, open(args.json, 'w'), indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -134,6 +134,48 @@ class ConfusionMatrix(object):
                 round(numpy.mean(recall), 4),
                 round(numpy.mean(f1), 4))
 
+    def to_dict(self):
+        """Labels and counts, with rows as predictions and columns as truth"""
+        num_classes = self.alphabet.size()
+        return {
+            'labels': [self.alphabet.get_label(i) for i in xrange(num_classes)],
+            'matrix': self.matrix[:num_classes, :num_classes].tolist()
+            }
+
+    @classmethod
+    def from_dict(cls, cm_dictionary):
+        """Create a ConfusionMatrix from a dictionary made by to_dict"""
+        alphabet = Alphabet()
+        for label in cm_dictionary['labels']:
+            alphabet.add(label)
+        cm = cls(alphabet)
+        cm.matrix = numpy.array(cm_dictionary['matrix'], dtype=float).reshape(
+            (alphabet.size(), alphabet.size()))
+        return cm
+
+    def collapse(self, label_to_parent):
+        """A confusion matrix over coarser labels
+
+        label_to_parent maps each label to the label it falls under, e.g.
+        a sense to the sense one level up. Labels that it does not map
+        stay as they are, and so does NEGATIVE_CLASS. The rows and the columns
+        of the labels that fall under the same parent are added up.
+        """
+        num_classes = self.alphabet.size()
+        parent_alphabet = Alphabet()
+        parent_index = numpy.zeros(num_classes, dtype=int)
+        for i in xrange(num_classes):
+            label = self.alphabet.get_label(i)
+            if label != self.NEGATIVE_CLASS:
+                label = label_to_parent.get(label, label)
+            parent_alphabet.add(label)
+            parent_index[i] = parent_alphabet.get_index(label)
+        cm = ConfusionMatrix(parent_alphabet)
+        rows, columns = numpy.indices((num_classes, num_classes))
+        numpy.add.at(cm.matrix, (parent_index[rows], parent_index[columns]),
+            self.matrix[:num_classes, :num_classes])
+        return cm
+
     def print_matrix(self):
         num_classes = self.alphabet.size()
         #header for the confusion matrix
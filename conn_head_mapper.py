@@ -2,12 +2,106 @@
 # -*- coding: utf-8 -*-
 
 
+from collections import OrderedDict
+
+
+_HEAD = None
+
+def normalize_connective(raw_connective):
+	"""Lowercase the connective and collapse the whitespace"""
+	return ' '.join(raw_connective.lower().split())
+
+def build_head_trie(head_connectives):
+	"""Build a token-level trie of head connectives
+
+	Each node is a dictionary from the next token to the child node. A node
+	where a head connective ends maps _HEAD to that head connective.
+	"""
+	trie = {}
+	for head_connective in head_connectives:
+		node = trie
+		for token in head_connective.split():
+			node = node.setdefault(token, {})
+		node[_HEAD] = head_connective
+	return trie
+
+def find_longest_head(trie, tokens, token_mapping):
+	"""Find the longest head connective in a list of tokens
+
+	The tokens are read once from left to right while we advance every
+	partial match that is still alive in the trie. A token also matches
+	its own head in token_mapping (e.g. afterwards -> afterward). Among
+	matches of the same length, the rightmost one wins, so
+	"two and a half years after" resolves to "after" rather than "and".
+
+	Returns:
+		(head connective, token indices) or None if nothing matches
+	"""
+	best = None
+	active = []
+	for i, token in enumerate(tokens):
+		mapped_token = token_mapping.get(token, token)
+		alternatives = [token] if mapped_token == token else [token, mapped_token]
+		new_active = []
+		for node, indices in active + [(trie, [])]:
+			for alternative in alternatives:
+				child = node.get(alternative)
+				if child is None:
+					continue
+				child_indices = indices + [i]
+				new_active.append((child, child_indices))
+				if _HEAD in child and (best is None or len(child_indices) >= len(best[1])):
+					best = (child[_HEAD], child_indices)
+		active = new_active
+	return best
+
+
 class ConnHeadMapper(object):
+	"""Map a raw connective to its head and the indices of the head tokens
+
+	The (head, indices) of every connective in the mapping is computed once
+	at construction and stored under the raw connective and its normalized
+	form, so looking up a known connective is a dictionary lookup. A connective
+	not in the mapping is its own head over all of its tokens, as the official
+	scorer has it. With resolve_unseen, it is resolved by the longest head
+	connective it contains instead (see find_longest_head). This is a
+	heuristic that moves the scores and picks the wrong head for connectives
+	like "and then" or "because of", so it is off by default. Unseen
+	connectives are kept in a bounded LRU memo.
+	The returned index lists are shared and should not be modified.
+	"""
 
-	def __init__(self):
+	MEMO_SIZE = 4096
+
+	def __init__(self, memo_size=MEMO_SIZE, resolve_unseen=False):
 		self.mapping = ConnHeadMapper.DEFAULT_MAPPING
+		self.memo_size = memo_size
+		self.resolve_unseen = resolve_unseen
+		self._memo = OrderedDict()
+		self._table = {}
+		for raw_connective in self.mapping:
+			self._table[raw_connective] = self._compute_head(raw_connective)
+		for raw_connective in self.mapping:
+			self._table.setdefault(normalize_connective(raw_connective),
+				self._table[raw_connective])
+		self._head_trie = None
+		if resolve_unseen:
+			self._head_trie = build_head_trie(set(self.mapping.values()))
 
 	def map_raw_connective(self, raw_connective):
+		result = self._table.get(raw_connective)
+		if result is None:
+			result = self._table.get(normalize_connective(raw_connective))
+		if result is None:
+			result = self._memo.pop(raw_connective, None)
+			if result is None:
+				result = self._resolve_unseen(raw_connective)
+				while self._memo and len(self._memo) >= self.memo_size:
+					self._memo.popitem(last=False)
+			self._memo[raw_connective] = result
+		return result
+
+	def _compute_head(self, raw_connective):
 		if raw_connective in self.mapping:
 			head_connective = self.mapping[raw_connective]
 		else:
@@ -26,7 +120,16 @@ class ConnHeadMapper(object):
 					start_point = i+1
 					break
 		assert(len(head_connective_token_list) == len(indices))
-		return head_connective, indices	
+		return head_connective, indices
+
+	def _resolve_unseen(self, raw_connective):
+		tokens = normalize_connective(raw_connective).split(' ')
+		result = None
+		if self.resolve_unseen:
+			result = find_longest_head(self._head_trie, tokens, self.mapping)
+		if result is None:
+			result = (' '.join(tokens), range(len(tokens)))
+		return result
 	
 	DEFAULT_MAPPING = {
 		"18 months after": "after", 
@@ -397,4 +500,27 @@ if __name__ == '__main__':
 	head_connective, indices = chm.map_raw_connective(raw_connective)
 	assert(head_connective == "as a result")
 	assert(indices == [1, 2 ,3])
+
+	# connectives not in the mapping are their own head
+	for raw_connective in ["and then", "or else", "not only but also",
+			"because of", "only if and when"]:
+		head_connective, indices = chm.map_raw_connective(raw_connective)
+		assert(head_connective == raw_connective)
+		assert(indices == range(len(raw_connective.split())))
+
+	raw_connective = "Only  Two Weeks Afterwards"
+	head_connective, indices = chm.map_raw_connective(raw_connective)
+	assert(head_connective == "only two weeks afterwards")
+	assert(indices == [0, 1, 2, 3])
+
+	chm = ConnHeadMapper(resolve_unseen=True)
+	raw_connective = "two and a half years after"
+	head_connective, indices = chm.map_raw_connective(raw_connective)
+	assert(head_connective == "after")
+	assert(indices == [5])
+
+	raw_connective = "Only  Two Weeks Afterwards"
+	head_connective, indices = chm.map_raw_connective(raw_connective)
+	assert(head_connective == "afterward")
+	assert(indices == [3])
 	
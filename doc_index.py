@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""Random access by DocID to parses.json and relations.json
+
+parses.json is one big JSON object keyed by DocID, and relations.json has one
+relation per line. Decoding the whole file just to look at a handful of
+documents is wasteful, so we scan the file once for the byte ranges of each
+document and decode the documents on demand through mmap.
+
+The byte ranges are saved next to the data file in a sidecar index
+(parses.json.docidx, relations.json.docidx) together with the size and
+modification time of the data file. The index is rebuilt when either of
+them changes, or when the sidecar cannot be read.
+"""
+import json
+import mmap
+import os
+import re
+from collections import OrderedDict
+
+from loader import is_plain_file, read_lines
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+INDEX_SUFFIX = '.docidx'
+INDEX_VERSION = 1
+
+_DOC_ID_PATTERN = re.compile(r'"DocID"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+def build_parse_offsets(buf):
+    """Find the byte range of every document in parses.json
+
+    Input:
+        buf : the content of parses.json (a string or an mmap)
+
+    Returns:
+        A dictionary mapping DocID to (offset, length) of its JSON object
+
+    Only the top-level keys are read in Python. Each document is skipped
+    with the C scanner of the json module, so this is about as fast as
+    json.load on the whole file.
+    """
+    text = buf[:]
+    decoder = json.JSONDecoder()
+    offsets = {}
+    position = _WHITESPACE.match(text, 0).end()
+    if position == len(text):
+        return offsets
+    if text[position] != '{':
+        raise ValueError('Expecting a JSON object at offset %s' % position)
+    position = _WHITESPACE.match(text, position + 1).end()
+    while text[position:position + 1] != '}':
+        if text[position:position + 1] != '"':
+            raise ValueError('Expecting a DocID at offset %s' % position)
+        doc_id, position = json.decoder.scanstring(text, position + 1)
+        position = _WHITESPACE.match(text, position).end()
+        if text[position:position + 1] != ':':
+            raise ValueError('Expecting : at offset %s' % position)
+        start = _WHITESPACE.match(text, position + 1).end()
+        _, end = decoder.raw_decode(text, start)
+        offsets[doc_id] = (start, end - start)
+        position = _WHITESPACE.match(text, end).end()
+        if text[position:position + 1] == ',':
+            position = _WHITESPACE.match(text, position + 1).end()
+    return offsets
+
+def build_relation_offsets(buf):
+    """Find the byte ranges of the relations of every document in a
+    JSON-lines relation file
+
+    Returns:
+        A dictionary mapping DocID to a list of (offset, length) of its lines
+    """
+    offsets = {}
+    start = 0
+    size = len(buf)
+    while start < size:
+        end = buf.find('\n', start)
+        if end == -1:
+            end = size
+        line = buf[start:end]
+        if line.strip():
+            match = _DOC_ID_PATTERN.search(line)
+            if match is not None:
+                doc_id = json.loads(match.group(1))
+            else:
+                doc_id = json.loads(line)['DocID']
+            offsets.setdefault(doc_id, []).append((start, end - start))
+        start = end + 1
+    return offsets
+
+def index_file_name(data_file):
+    return data_file + INDEX_SUFFIX
+
+def _file_signature(data_file):
+    stat = os.stat(data_file)
+    return [stat.st_size, stat.st_mtime]
+
+def load_offsets(data_file, buf, build_offsets):
+    """Read the byte ranges of data_file from its sidecar index
+
+    The index is rebuilt with build_offsets(buf) and saved if it is missing
+    or stale. A sidecar that cannot be written (e.g. a read-only dataset
+    directory) is not an error; the index is then rebuilt every time.
+    """
+    signature = _file_signature(data_file)
+    index_file = index_file_name(data_file)
+    try:
+        index = json.load(open(index_file))
+        if index['version'] == INDEX_VERSION and index['signature'] == signature:
+            return index['offsets']
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
+    offsets = build_offsets(buf)
+    index = {'version': INDEX_VERSION, 'signature': signature, 'offsets': offsets}
+    tmp_file = '%s.%s.tmp' % (index_file, os.getpid())
+    try:
+        json.dump(index, open(tmp_file, 'w'))
+        os.rename(tmp_file, index_file)
+    except (IOError, OSError):
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return offsets
+
+
+class ParseLookup(object):
+    """Load the parses of the documents in parses.json by DocID
+
+    Only the byte offsets of the documents are kept in memory. A document
+    is decoded when it is requested, and the most recently used documents
+    are kept around so that consecutive relations from the same document
+    do not decode it again.
+    """
+
+    def __init__(self, parse_file, cache_size=16, use_index=True):
+        self.parse_file = parse_file
+        self.cache_size = cache_size
+        self._file = open(parse_file, 'rb')
+        if os.path.getsize(parse_file) > 0:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # mmap cannot map an empty file
+            self._buffer = ''
+        if use_index:
+            self.offsets = load_offsets(parse_file, self._buffer, build_parse_offsets)
+        else:
+            self.offsets = build_parse_offsets(self._buffer)
+        self._cache = OrderedDict()
+
+    def __contains__(self, doc_id):
+        return doc_id in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, doc_id):
+        if doc_id in self._cache:
+            doc = self._cache.pop(doc_id)
+        else:
+            offset, length = self.offsets[doc_id]
+            doc = json.loads(self._buffer[offset:offset + length])
+            while self._cache and len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[doc_id] = doc
+        return doc
+
+    def doc_ids(self):
+        """DocIDs in the order they appear in the file"""
+        return sorted(self.offsets, key=lambda x: self.offsets[x][0])
+
+    def close(self):
+        self._cache.clear()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+
+class RelationLookup(object):
+    """Load the relations of the documents in a JSON-lines file by DocID"""
+
+    def __init__(self, relation_file, use_index=True):
+        self.relation_file = relation_file
+        self._file = open(relation_file, 'rb')
+        if os.path.getsize(relation_file) > 0:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # mmap cannot map an empty file
+            self._buffer = ''
+        if use_index:
+            self.offsets = load_offsets(relation_file, self._buffer, build_relation_offsets)
+        else:
+            self.offsets = build_relation_offsets(self._buffer)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, doc_id):
+        """The relations of a document in file order (empty if it has none)"""
+        return [json.loads(self._buffer[offset:offset + length])
+            for offset, length in self.offsets.get(doc_id, [])]
+
+    def get_relations(self, doc_ids):
+        """The relations of several documents in file order"""
+        ranges = []
+        for doc_id in set(doc_ids):
+            ranges.extend(self.offsets.get(doc_id, []))
+        ranges.sort()
+        return [json.loads(self._buffer[offset:offset + length])
+            for offset, length in ranges]
+
+    def doc_ids(self):
+        """DocIDs in the order of their first relation in the file"""
+        return sorted(self.offsets, key=lambda x: self.offsets[x][0][0])
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+def load_document_relations(gold_file, predicted_file, doc_ids):
+    """Load only the gold and predicted relations of the given documents
+
+    Returns:
+        A tuple of (gold relation list, predicted relation list)
+    """
+    relation_lists = []
+    for relation_file in [gold_file, predicted_file]:
+        if not is_plain_file(relation_file):
+            # a compressed or archived file cannot be memory-mapped
+            doc_id_set = set(doc_ids)
+            relations = (json.loads(x) for x in read_lines(relation_file))
+            relation_lists.append([x for x in relations if x['DocID'] in doc_id_set])
+            continue
+        lookup = RelationLookup(relation_file)
+        relation_lists.append(lookup.get_relations(doc_ids))
+        lookup.close()
+    return tuple(relation_lists)
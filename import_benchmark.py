@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Import-time benchmark for the command line tools
+
+The scorers are run once per system output, so the time it takes to import
+them adds up. Importing them should not load NumPy, the aligner, or the
+connective head table. Those are loaded on first use. This benchmark imports
+each module in a fresh interpreter several times. It reports the median import
+time and the heavy modules that got loaded. It exits with status 1 when a
+module goes over the time budget or loads a module it should not load.
+
+python import_benchmark.py --budget-ms 100
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = ['scorer', 'partial_scorer', 'tira_eval', 'tira_sup_eval', 'validator']
+
+# Modules that must only be imported when something is scored
+DEFERRED_MODULES = ['numpy', 'confusion_matrix', 'conn_head_mapper', 'aligner',
+    'threading_timer_decorator_exit', 'multiprocessing']
+
+_MEASURE = '''
+import json, sys
+from timeit import default_timer
+start_time = default_timer()
+import %s
+elapsed = default_timer() - start_time
+print json.dumps({'seconds': elapsed,
+    'loaded': [x for x in %r if sys.modules.get(x) is not None]})
+'''
+
+def measure_import(module, python=sys.executable):
+    """Import module in a new interpreter
+
+    Returns:
+        A tuple of (seconds, list of DEFERRED_MODULES that were loaded)
+    """
+    output = subprocess.check_output([python, '-c', _MEASURE % (module, DEFERRED_MODULES)])
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+def run_benchmark(modules, repeat, python=sys.executable):
+    results = {}
+    for module in modules:
+        timings = []
+        loaded = set()
+        for _ in xrange(repeat):
+            seconds, loaded_modules = measure_import(module, python)
+            timings.append(seconds)
+            loaded.update(loaded_modules)
+        timings.sort()
+        results[module] = {'median_ms': timings[len(timings) // 2] * 1000,
+            'max_ms': timings[-1] * 1000, 'loaded': sorted(loaded)}
+    return results
+
+def find_violations(results, budget_ms):
+    """Modules over the budget or loading deferred modules"""
+    violations = []
+    for module in sorted(results):
+        result = results[module]
+        if result['median_ms'] > budget_ms:
+            violations.append('%s takes %1.1f ms to import (budget %1.1f ms)' %
+                (module, result['median_ms'], budget_ms))
+        if result['loaded']:
+            violations.append('%s loads %s at import time' %
+                (module, ', '.join(result['loaded'])))
+    return violations
+
+def print_results(results):
+    print '%-15s %10s %10s %s' % ('module', 'median ms', 'max ms', 'deferred modules loaded')
+    for module in sorted(results):
+        result = results[module]
+        print '%-15s %10.1f %10.1f %s' % (module, result['median_ms'], result['max_ms'],
+            ', '.join(result['loaded']) or '-')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the scorers')
+    parser.add_argument('--modules', default=','.join(MODULES),
+        help='Comma-separated modules to import')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--budget-ms', default=100.0, type=float,
+        help='Largest acceptable median import time of a module')
+    parser.add_argument('--json', help='Write the timings to this file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modules.split(','), args.repeat)
+    print_results(results)
+    if args.json is not None:
+        json.dump(results, open(args.json, 'w'), indent=2, sort_keys=True)
+    violations = find_violations(results, args.budget_ms)
+    for violation in violations:
+        print 'OVER BUDGET %s' % violation
+    if violations:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
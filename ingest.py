@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Single-pass ingest of relation files for the TIRA evaluators
+
+The TIRA evaluators used to decode output.json, validate the decoded relations
+in a second loop, and convert their token lists in a third. ingest_relations
+reads the file line by line and does all of it to each relation before it
+reads the next one:
+
+    decode the JSON line
+    check the fields the scorers need (validator.check_structure)
+    check the type and the sense against the language of the gold standard
+    convert the Arg1 and Arg2 token lists to span.Span (see span.relation_spans)
+    count the senses that identify the language
+    index the relations by ID, for the supplementary task
+
+A hard error is one that leaves the relation unusable: a line that is not
+JSON, a missing field, a TokenList that is not a list of tokens. It raises
+IngestError at once, because the file cannot be scored anyway. A soft error,
+an unknown type or sense or NoRel, is recorded and the ingest goes on, so that
+all of them can be reported together. Blank lines are skipped.
+
+Reading goes through loader.read_lines, so compressed files and files in tar
+archives work as well.
+"""
+import json
+import sys
+
+import validator
+from loader import read_lines
+from span import token_span
+
+EN_SENSE_SET = frozenset(validator.EN_SENSES)
+ZH_SENSE_SET = frozenset(validator.ZH_SENSES)
+
+
+class IngestError(ValueError):
+    """A relation that cannot be scored"""
+
+    def __init__(self, file_name, index, message):
+        ValueError.__init__(self, '%s: Relation %s %s' % (file_name, index, message))
+        self.file_name = file_name
+        self.index = index
+
+
+class IngestedRelations(object):
+    """The relations of a file and what was found out about them on the way
+
+    spans are the (Arg1 span, Arg2 span) of the relations, as returned by
+    span.relation_spans, for scoring.Scorer. soft_errors are (relation index,
+    message) pairs. by_id maps each ID to its first relation and
+    duplicate_ids lists the IDs seen again; both are None unless the
+    relations were indexed by ID.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.relations = []
+        self.spans = []
+        self.soft_errors = []
+        self.num_en_senses = 0
+        self.num_zh_senses = 0
+        self.by_id = None
+        self.duplicate_ids = None
+
+    def language(self):
+        """The language of the senses, like validator.identify_language"""
+        return 'en' if self.num_en_senses > self.num_zh_senses else 'zh'
+
+    def report_soft_errors(self, f=sys.stderr):
+        """Write the soft errors the way validator.validate_relation_list does
+
+        Returns:
+            True if there was any
+        """
+        for index, message in self.soft_errors:
+            f.write('Relation %s %s\n' % (index, message))
+        return len(self.soft_errors) > 0
+
+def ingest_relations(file_name, language=None, index_ids=False):
+    """Decode, validate, and index a JSON-lines relation file in one pass
+
+    Input:
+        language : 'en' or 'zh' to check the types and the senses, or None
+            for a gold standard, which only gets the hard checks
+        index_ids : whether to fill in by_id and duplicate_ids
+
+    Returns:
+        An IngestedRelations
+
+    Raises:
+        IngestError on the first hard error
+    """
+    ingested = IngestedRelations(file_name)
+    if index_ids:
+        ingested.by_id = {}
+        ingested.duplicate_ids = []
+    relations = ingested.relations
+    index = 0
+    for line in read_lines(file_name):
+        if not line.strip():
+            continue
+        try:
+            relation = json.loads(line)
+        except ValueError as error:
+            raise IngestError(file_name, index, 'is not valid JSON: %s' % error)
+        try:
+            validator.check_structure(relation)
+            spans = (token_span(relation['Arg1']), token_span(relation['Arg2']))
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as error:
+            raise IngestError(file_name, index, error)
+        if language is not None:
+            try:
+                validator.check_type(relation)
+                validator.check_sense(relation, language)
+            except (ValueError, TypeError) as error:
+                ingested.soft_errors.append((index, str(error)))
+        sense = relation['Sense'][0]
+        if isinstance(sense, basestring):
+            if sense in EN_SENSE_SET:
+                ingested.num_en_senses += 1
+            elif sense in ZH_SENSE_SET:
+                ingested.num_zh_senses += 1
+        if index_ids:
+            try:
+                relation_id = relation['ID']
+                seen = relation_id in ingested.by_id
+            except (KeyError, TypeError):
+                raise IngestError(file_name, index,
+                    'Field \'ID\' is required and must be a number or a string')
+            if seen:
+                ingested.duplicate_ids.append(relation_id)
+            else:
+                ingested.by_id[relation_id] = relation
+        relations.append(relation)
+        ingested.spans.append(spans)
+        index += 1
+    return ingested
+
+def ingest_gold_and_predicted(gold_file, predicted_file, index_predicted_ids=False):
+    """Ingest the gold standard, then the system output against the language
+    of the gold standard
+
+    Returns:
+        A tuple of (gold IngestedRelations, predicted IngestedRelations)
+    """
+    gold = ingest_relations(gold_file)
+    predicted = ingest_relations(predicted_file, gold.language(), index_predicted_ids)
+    return gold, predicted
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Loading of JSON-lines relation files
+
+The relations are decoded one line at a time in the calling process. A
+process pool does not pay off here: pickling the decoded dictionaries back to
+the parent costs more than decoding them there.
+
+Files compressed with gzip, bzip2, or xz (.gz, .bz2, .xz) and files inside a
+tar archive are read as a stream without unpacking them to disk. A file in an
+archive is named by the path of the archive followed by the path of the file
+in it, where the top folder of the archive can be left out, e.g.
+tutorial/conll16st-en-01-12-16-trial.tar.gz/relations.json. The archive can
+therefore be given wherever a dataset folder is expected.
+"""
+import json
+import os
+
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+def _open_xz(file_name):
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise IOError('Reading %s needs the lzma module (pip install backports.lzma)'
+                % file_name)
+    return lzma.LZMAFile(file_name)
+
+def _open_gzip(file_name):
+    import gzip
+    return gzip.open(file_name, 'rb')
+
+def _open_bz2(file_name):
+    import bz2
+    return bz2.BZ2File(file_name)
+
+DECOMPRESSORS = {
+    '.gz': _open_gzip,
+    '.tgz': _open_gzip,
+    '.bz2': _open_bz2,
+    '.xz': _open_xz,
+    }
+
+def split_archive_path(file_name):
+    """Split a path into a tar archive into (archive, member)
+
+    Returns:
+        (None, file_name) if file_name does not point into an archive
+    """
+    if os.path.exists(file_name):
+        return None, file_name
+    parts = file_name.split('/')
+    for i in xrange(len(parts) - 1, 0, -1):
+        archive = '/'.join(parts[:i])
+        if archive.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(archive):
+            return archive, '/'.join(parts[i:])
+    return None, file_name
+
+def find_input(file_name):
+    """file_name, or the compressed file_name.gz, file_name.bz2, or
+    file_name.xz when only that one exists"""
+    if split_archive_path(file_name)[0] is not None or os.path.exists(file_name):
+        return file_name
+    for suffix in ('.gz', '.bz2', '.xz'):
+        if os.path.exists(file_name + suffix):
+            return file_name + suffix
+    return file_name
+
+def is_plain_file(file_name):
+    """True if file_name is an uncompressed file outside an archive, which
+    can be memory-mapped"""
+    return split_archive_path(file_name)[0] is None and \
+        os.path.splitext(file_name)[1] not in DECOMPRESSORS
+
+def open_compressed(file_name):
+    """Open a file for reading, decompressing it by its suffix"""
+    decompressor = DECOMPRESSORS.get(os.path.splitext(file_name)[1])
+    if decompressor is None:
+        return open(file_name, 'rb')
+    return decompressor(file_name)
+
+def read_lines(file_name):
+    """Stream the lines of a plain, compressed, or archived file"""
+    archive, member = split_archive_path(file_name)
+    if archive is None:
+        f = open_compressed(file_name)
+        try:
+            for line in f:
+                yield line
+        finally:
+            f.close()
+        return
+    import tarfile
+    archive_file = open_compressed(archive)
+    try:
+        # stream mode reads the members in order without seeking
+        tar = tarfile.open(fileobj=archive_file, mode='r|')
+        for info in tar:
+            if info.isfile() and (info.name == member or info.name.endswith('/' + member)):
+                for line in tar.extractfile(info):
+                    yield line
+                return
+        raise IOError('%s has no file %s' % (archive, member))
+    finally:
+        archive_file.close()
+
+def read_file(file_name):
+    """The content of a plain, compressed, or archived file"""
+    return ''.join(read_lines(file_name))
+
+def load_relation_files(file_names):
+    """Decode several JSON-lines files
+
+    Returns:
+        A list with the list of relations in each file
+    """
+    return [[json.loads(x) for x in read_lines(file_name)] for file_name in file_names]
+
+def load_relations(file_name):
+    """Decode a JSON-lines file of relations"""
+    return load_relation_files([file_name])[0]
+
+def load_gold_and_predicted(gold_file, predicted_file):
+    """Decode the gold standard and the system output
+
+    Returns:
+        A tuple of (gold relation list, predicted relation list)
+    """
+    gold_list, predicted_list = load_relation_files([gold_file, predicted_file])
+    return gold_list, predicted_list
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Throughput and memory benchmark for discourse parsers
+
+Runs the parse_doc method of a DiscourseParser over every document in a
+dataset and reports documents/sec, tokens/sec, per-document latency
+percentiles, peak memory, and the slowest documents.
+
+python parser_benchmark.py path/to/data_dir
+python parser_benchmark.py --parser my_parser.DiscourseParser --json bench.json path/to/data_dir
+
+The JSON report is meant to be kept around so that runs can be compared
+over time.
+"""
+import argparse
+import importlib
+import json
+import platform
+import resource
+import sys
+import time
+from timeit import default_timer
+
+from doc_index import ParseLookup
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PERCENTILES = [50, 90, 95, 99]
+
+def load_parser(parser_name):
+    """Instantiate a parser given as module.ClassName"""
+    module_name, class_name = parser_name.rsplit('.', 1)
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
+
+def count_tokens(doc):
+    return sum(len(sentence['words']) for sentence in doc['sentences'])
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = int(round(p / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on OS X, kilobytes everywhere else
+        return max_rss / (1024.0 * 1024.0)
+    return max_rss / 1024.0
+
+def benchmark(parser, parse_file, num_slowest=10):
+    """Time parse_doc on every document in parse_file
+
+    Returns:
+        A dictionary with the benchmark report
+    """
+    doc_lookup = ParseLookup(parse_file, cache_size=1)
+    if tracemalloc is not None:
+        tracemalloc.start()
+    doc_timings = []
+    total_tokens = 0
+    total_relations = 0
+    start_time = default_timer()
+    for doc_id in doc_lookup.doc_ids():
+        doc = doc_lookup[doc_id]
+        num_tokens = count_tokens(doc)
+        doc_start_time = default_timer()
+        relations = parser.parse_doc(doc, doc_id)
+        elapsed = default_timer() - doc_start_time
+        doc_timings.append((elapsed, doc_id, num_tokens, len(relations)))
+        total_tokens += num_tokens
+        total_relations += len(relations)
+    wall_time = default_timer() - start_time
+    parse_time = sum(x[0] for x in doc_timings)
+    if tracemalloc is not None:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        traced_peak_mb = traced_peak / (1024.0 * 1024.0)
+    else:
+        traced_peak_mb = None
+    doc_lookup.close()
+
+    latencies = sorted(x[0] for x in doc_timings)
+    slowest = sorted(doc_timings, reverse=True)[:num_slowest]
+    return {
+        'num_documents': len(doc_timings),
+        'num_tokens': total_tokens,
+        'num_relations': total_relations,
+        'wall_time': wall_time,
+        'parse_time': parse_time,
+        'documents_per_second': len(doc_timings) / parse_time if parse_time > 0 else 0.0,
+        'tokens_per_second': total_tokens / parse_time if parse_time > 0 else 0.0,
+        'latency_percentiles': dict(
+            ('p%s' % p, percentile(latencies, p)) for p in PERCENTILES),
+        'max_latency': latencies[-1] if latencies else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'traced_peak_mb': traced_peak_mb,
+        'slowest_documents': [
+            {'DocID': doc_id, 'seconds': elapsed, 'tokens': num_tokens,
+                'relations': num_relations}
+            for elapsed, doc_id, num_tokens, num_relations in slowest],
+        }
+
+def print_report(report):
+    print 'Documents          : %s' % report['num_documents']
+    print 'Tokens             : %s' % report['num_tokens']
+    print 'Relations          : %s' % report['num_relations']
+    print 'Parse time         : %1.4f sec (wall %1.4f sec)' % \
+        (report['parse_time'], report['wall_time'])
+    print 'Documents/sec      : %1.2f' % report['documents_per_second']
+    print 'Tokens/sec         : %1.2f' % report['tokens_per_second']
+    print 'Latency (sec)      : %s max %1.4f' % (
+        ' '.join('p%s %1.4f' % (p, report['latency_percentiles']['p%s' % p])
+            for p in PERCENTILES),
+        report['max_latency'])
+    print 'Peak RSS           : %1.1f MB' % report['peak_rss_mb']
+    if report['traced_peak_mb'] is not None:
+        print 'Peak traced memory : %1.1f MB' % report['traced_peak_mb']
+    print 'Slowest documents --------------'
+    for doc in report['slowest_documents']:
+        print '%s\t%1.4f sec\t%s tokens\t%s relations' % \
+            (doc['DocID'], doc['seconds'], doc['tokens'], doc['relations'])
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the throughput and memory use of a discourse parser')
+    parser.add_argument('input_dataset', help='Dataset folder containing parses.json')
+    parser.add_argument('--parser', default='sample_parser.DiscourseParser',
+        help='Parser class given as module.ClassName')
+    parser.add_argument('--slowest', default=10, type=int,
+        help='Number of slowest documents to list')
+    parser.add_argument('--json', help='Write the report to this file as JSON')
+    args = parser.parse_args()
+
+    discourse_parser = load_parser(args.parser)
+    report = benchmark(discourse_parser, '%s/parses.json' % args.input_dataset, args.slowest)
+    print_report(report)
+    if args.json is not None:
+        report['parser'] = args.parser
+        report['input_dataset'] = args.input_dataset
+        report['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        report['python_version'] = platform.python_version()
+        json.dump(report, open(args.json, 'w'), indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
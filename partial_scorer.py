@@ -5,29 +5,128 @@
 """
 
 import argparse
-import json
 
 import validator
-import aligner
-import scorer
 
-from confusion_matrix import ConfusionMatrix, Alphabet
-from conn_head_mapper import ConnHeadMapper
+from alignment_cache import DEFAULT_CACHE_DIR, AlignmentCache
+from doc_index import load_document_relations
+from loader import load_gold_and_predicted
+from profiler import PROFILER, add_profile_arguments, start_profile, finish_profile
 
-def partial_evaluate(gold_list, predicted_list, partial_match_cutoff):
-    """Evaluate the parse output with partial matching for arguments
+def _numpy():
+    """NumPy, imported on first use"""
+    import numpy
+    return numpy
+
+def _confusion_matrix():
+    """The confusion_matrix module, imported on first use as it loads NumPy"""
+    import confusion_matrix
+    return confusion_matrix
+
+def partial_evaluate(gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids=None,
+        alignment_cache=None, sense_levels=None):
+    """Evaluate the parse output with partial matching for arguments and
+    print the report
+
+    Returns the PRF tuples for Arg1, Arg2, Arg1 & Arg2 and the parser.
+    score_partial also returns the counts and the confusion matrices behind
+    them.
+
+    The documents in bounded_doc_ids are aligned greedily instead of
+    with the exact search (see alignment_complexity.select_bounded_doc_ids).
+    An alignment_cache.AlignmentCache reuses the alignments of earlier runs.
+    The sense confusion matrices at the levels of the sense hierarchy in
+    sense_levels are printed as well.
     """
     print 'PARTIAL EVALUATION - For diagnostics only and not for ranking'
     print 'Aligning relations - This will time out after 120 seconds'
-    arg1_alignment, arg2_alignment, relation_alignment = \
-        aligner.align_relations(gold_list, predicted_list, partial_match_cutoff)
-    arg1_match_prf, arg2_match_prf, total_match_prf = \
-        evaluate_args(arg1_alignment, arg2_alignment, partial_match_cutoff)
-    entire_relation_match_prf = \
-        evaluate_rel_arg_whole_rel(relation_alignment, partial_match_cutoff)
-    valid_senses = validator.identify_valid_senses(gold_list)
-    sense_cm = evaluate_sense(relation_alignment, valid_senses)
+    result_tuple = score_partial(gold_list, predicted_list, partial_match_cutoff,
+        bounded_doc_ids, alignment_cache, sense_levels)
+    with PROFILER.phase('report printing'):
+        print_partial_result(result_tuple, partial_match_cutoff)
+    return result_tuple[:4]
+
+def score_partial(gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids=None,
+        alignment_cache=None, sense_levels=None, valid_senses=None, gold_spans=None,
+        predicted_spans=None):
+    """partial_evaluate() without printing anything
 
+    Returns the tuple of partial_evaluate() followed by a dictionary with the
+    raw (gold, predicted, correct) counts behind it, the sense confusion
+    matrix, and the sense confusion matrices at sense_levels.
+
+    valid_senses are those of gold_list unless they are given, and so are
+    gold_spans and predicted_spans, the span.relation_spans of the lists.
+    """
+    import aligner
+    with PROFILER.phase('alignment'):
+        arg1_alignment, arg2_alignment, relation_alignment = aligner.align_relation_arrays(
+            gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids, alignment_cache,
+            gold_spans, predicted_spans)
+    with PROFILER.phase('partial argument scoring'):
+        arg1_counts = evaluate_arg_partial_match(arg1_alignment, 1, partial_match_cutoff)
+        arg2_counts = evaluate_arg_partial_match(arg2_alignment, 2, partial_match_cutoff)
+        arg1_match_prf, arg2_match_prf, total_match_prf = \
+            compute_arg_prfs(arg1_counts, arg2_counts)
+        relation_counts = count_rel_arg_whole_rel(relation_alignment, partial_match_cutoff)
+        entire_relation_match_prf = compute_prf(*relation_counts)
+    with PROFILER.phase('token-wise argument scoring'):
+        arg1_token_counts = count_arg_tokens(arg1_alignment, 1)
+        arg2_token_counts = count_arg_tokens(arg2_alignment, 2)
+        arg1_token_totals = sum_token_counts(arg1_token_counts)
+        arg2_token_totals = sum_token_counts(arg2_token_counts)
+        arg1_tokenwise_prf, arg2_tokenwise_prf, total_tokenwise_prf = \
+            compute_arg_prfs(arg1_token_totals, arg2_token_totals)
+    with PROFILER.phase('sense scoring'):
+        if valid_senses is None:
+            valid_senses = validator.identify_valid_senses(gold_list)
+        sense_cm = evaluate_sense(relation_alignment, valid_senses)
+        sense_level_cms = []
+        if sense_levels:
+            from scorer import collapse_sense_levels
+            sense_level_cms = collapse_sense_levels(sense_cm, sense_levels)
+
+    details = {
+        'counts': {
+            'Arg1': arg1_counts,
+            'Arg2': arg2_counts,
+            'Arg 1 Arg2': relation_counts,
+            },
+        'tokenwise_counts': {
+            'Arg1': arg1_token_totals,
+            'Arg2': arg2_token_totals,
+            'Arg 1 Arg2': tuple(x + y for x, y in zip(arg1_token_totals, arg2_token_totals)),
+            },
+        'tokenwise_prf': {
+            'Arg1': arg1_tokenwise_prf,
+            'Arg2': arg2_tokenwise_prf,
+            'Arg 1 Arg2': total_tokenwise_prf,
+            },
+        'tokenwise_document_counts': {
+            'Arg1': token_counts_by_document(arg1_token_counts),
+            'Arg2': token_counts_by_document(arg2_token_counts),
+            },
+        'sense_cm': sense_cm,
+        'sense_level_cms': sense_level_cms,
+        }
+    return arg1_match_prf, arg2_match_prf, entire_relation_match_prf, \
+        sense_cm.compute_micro_average_f1(), details
+
+def print_partial_result(result_tuple, partial_match_cutoff):
+    """Print the report of a score_partial() result"""
+    arg1_match_prf, arg2_match_prf, entire_relation_match_prf, _, details = result_tuple
+    total_match_prf = compute_arg_prfs(details['counts']['Arg1'], details['counts']['Arg2'])[2]
+    print_partial_evaluation(arg1_match_prf, arg2_match_prf, total_match_prf,
+        entire_relation_match_prf, details['sense_cm'], partial_match_cutoff)
+    tokenwise_prf = details['tokenwise_prf']
+    print_tokenwise_evaluation(tokenwise_prf['Arg1'], tokenwise_prf['Arg2'],
+        tokenwise_prf['Arg 1 Arg2'])
+    if details['sense_level_cms']:
+        from scorer import print_sense_levels
+        print_sense_levels(details['sense_level_cms'])
+
+def print_partial_evaluation(arg1_match_prf, arg2_match_prf, total_match_prf,
+        entire_relation_match_prf, sense_cm, partial_match_cutoff):
     print 'Arg 1 extractor (partial matching)                     : Precision %1.4f Recall %1.4f F1 %1.4f' % arg1_match_prf
     print 'Arg 2 extractor (partial matching)                     : Precision %1.4f Recall %1.4f F1 %1.4f' % arg2_match_prf
 
@@ -41,15 +140,23 @@ def partial_evaluate(gold_list, predicted_list, partial_match_cutoff):
     precision, recall, f1 = sense_cm.compute_micro_average_f1()
     print 'Precision %1.4f Recall %1.4f F1 %1.4f' % (precision, recall, f1)
 
-    return arg1_match_prf, arg2_match_prf, entire_relation_match_prf, \
-        sense_cm.compute_micro_average_f1()
+def print_tokenwise_evaluation(arg1_tokenwise_prf, arg2_tokenwise_prf, total_tokenwise_prf):
+    print 'Token-wise argument overlap--------------'
+    print 'Arg 1 extractor (token-wise)                           : Precision %1.4f Recall %1.4f F1 %1.4f' % arg1_tokenwise_prf
+    print 'Arg 2 extractor (token-wise)                           : Precision %1.4f Recall %1.4f F1 %1.4f' % arg2_tokenwise_prf
+    print 'Concatenated Arg 1 Arg 2 extractor (token-wise)        : Precision %1.4f Recall %1.4f F1 %1.4f' % total_tokenwise_prf
 
 def evaluate_args(arg1_alignment, arg2_alignment, partial_match_cutoff):
     """Evaluate argument matches"""
-    total_arg1_gold, total_arg1_predicted, total_arg1_correct = \
-            evaluate_arg_partial_match(arg1_alignment, 1, partial_match_cutoff)
-    total_arg2_gold, total_arg2_predicted, total_arg2_correct = \
-            evaluate_arg_partial_match(arg2_alignment, 2, partial_match_cutoff)
+    return compute_arg_prfs(
+        evaluate_arg_partial_match(arg1_alignment, 1, partial_match_cutoff),
+        evaluate_arg_partial_match(arg2_alignment, 2, partial_match_cutoff))
+
+def compute_arg_prfs(arg1_counts, arg2_counts):
+    """Compute Arg1, Arg2, and concatenated Arg1 Arg2 PRF from the
+    (gold, predicted, correct) counts"""
+    total_arg1_gold, total_arg1_predicted, total_arg1_correct = arg1_counts
+    total_arg2_gold, total_arg2_predicted, total_arg2_correct = arg2_counts
     arg1_prf = compute_prf(
         total_arg1_gold, total_arg1_predicted, total_arg1_correct)
     arg2_prf = compute_prf(
@@ -60,75 +167,71 @@ def evaluate_args(arg1_alignment, arg2_alignment, partial_match_cutoff):
         total_arg1_correct + total_arg2_correct)
     return arg1_prf, arg2_prf, rel_arg_prf
 
-def evaluate_arg_tokenwise(relation_pairs, position):
+def evaluate_arg_tokenwise(alignment, position):
+    """Evaluate the argument by the tokens it shares with its aligned argument
+
+    Returns:
+        (gold, predicted, correct) token counts over all alignments
+    """
+    return sum_token_counts(count_arg_tokens(alignment, position))
+
+def count_arg_tokens(alignment, position):
+    """Count the gold, predicted, and shared argument tokens of every pair
+    of an aligner.IndexAlignment
+
+    Returns:
+        A tuple of (DocIDs, gold counts, predicted counts, correct counts)
+        with one entry per pair
+    """
     assert position == 1 or position == 2
-    total_correct = 0.0
-    total_gold = 0.0
-    total_predicted = 0.0
-    for g_relation, p_relation in relation_pairs:
-        assert g_relation is not None or p_relation is not None
-        g_arg = g_relation['Arg%s' % position]['TokenIndexSet'] \
-                if g_relation is not None else set([])
-        p_arg = p_relation['Arg%s' % position]['TokenIndexSet'] \
-                if p_relation is not None else set([])
-        total_correct += len(g_arg.intersection(p_arg))
-        total_gold += len(g_arg)
-        total_predicted += len(p_arg)
-    return total_gold, total_predicted, total_correct
+    key = 'Arg%s' % position
+    return alignment.doc_ids(), alignment.gold_sizes[key], \
+        alignment.predicted_sizes[key], alignment.shared[key]
+
+def sum_token_counts(token_counts):
+    """Total (gold, predicted, correct) of the output of count_arg_tokens"""
+    _, gold, predicted, correct = token_counts
+    return float(gold.sum()), float(predicted.sum()), float(correct.sum())
 
-def evaluate_arg_partial_match(relation_pairs, position, partial_match_cutoff):
+def token_counts_by_document(token_counts):
+    """Per-document (gold, predicted, correct) of the output of count_arg_tokens"""
+    numpy = _numpy()
+    doc_ids, gold, predicted, correct = token_counts
+    if len(doc_ids) == 0:
+        return {}
+    unique_doc_ids, doc_labels = numpy.unique(doc_ids, return_inverse=True)
+    counts = [numpy.bincount(doc_labels, weights=x, minlength=len(unique_doc_ids))
+        for x in (gold, predicted, correct)]
+    return dict((doc_id, (float(counts[0][i]), float(counts[1][i]), float(counts[2][i])))
+        for i, doc_id in enumerate(unique_doc_ids))
+
+def evaluate_arg_partial_match(alignment, position, partial_match_cutoff):
     """Evaluate the argument based on partial matching criterion
 
     We evaluate the argument as a whole. 
     """
     assert position == 1 or position == 2
-    total_correct = 0.0
-    total_gold = 0.0
-    total_predicted = 0.0
-    for g_relation, p_relation in relation_pairs:
-        assert g_relation is not None or p_relation is not None
-        if g_relation is None:
-            total_predicted += 1
-        elif p_relation is None:
-            total_gold += 1
-        else:
-            g_arg = g_relation['Arg%s' % position]['TokenIndexSet']
-            p_arg = p_relation['Arg%s' % position]['TokenIndexSet']
-            f1_score = aligner.compute_f1_span(g_arg, p_arg)
-            if f1_score >= partial_match_cutoff:
-                total_correct += 1
-            total_predicted += 1
-            total_gold += 1
-    return total_gold, total_predicted, total_correct
+    both = alignment.has_gold & alignment.has_predicted
+    total_correct = (both & (alignment.arg_f1(position) >= partial_match_cutoff)).sum()
+    return float(alignment.has_gold.sum()), float(alignment.has_predicted.sum()), \
+        float(total_correct)
 
-def evaluate_rel_arg_whole_rel(relation_pairs, partial_match_cutoff):
-    total_correct = 0.0
-    total_gold = 0.0
-    total_predicted = 0.0
-    for g_relation, p_relation in relation_pairs:
-        assert g_relation is not None or p_relation is not None
-        if g_relation is None:
-            total_predicted += 1
-        elif p_relation is None:
-            total_gold += 1
-        else:
-            g_arg1 = g_relation['Arg1']['TokenIndexSet'] \
-                    if g_relation is not None else set([])
-            p_arg1 = p_relation['Arg1']['TokenIndexSet'] \
-                    if p_relation is not None else set([])
-            arg1_f1_score = aligner.compute_f1_span(g_arg1, p_arg1)
-
-            g_arg2 = g_relation['Arg2']['TokenIndexSet'] \
-                    if g_relation is not None else set([])
-            p_arg2 = p_relation['Arg2']['TokenIndexSet'] \
-                    if p_relation is not None else set([])
-            arg2_f1_score = aligner.compute_f1_span(g_arg2, p_arg2)
-            if arg1_f1_score >= partial_match_cutoff and \
-                arg2_f1_score >= partial_match_cutoff:
-                total_correct += 1
-                total_predicted += 1
-                total_gold += 1
-    return compute_prf(total_gold, total_predicted, total_correct)
+def evaluate_rel_arg_whole_rel(alignment, partial_match_cutoff):
+    return compute_prf(*count_rel_arg_whole_rel(alignment, partial_match_cutoff))
+
+def count_rel_arg_whole_rel(alignment, partial_match_cutoff):
+    """Count the relations whose Arg1 and Arg2 both match partially
+
+    An aligned pair whose arguments do not both match counts neither as gold
+    nor as predicted.
+    """
+    correct = alignment.has_gold & alignment.has_predicted & \
+        (alignment.arg_f1(1) >= partial_match_cutoff) & \
+        (alignment.arg_f1(2) >= partial_match_cutoff)
+    total_correct = float(correct.sum())
+    total_gold = float((alignment.has_gold & ~alignment.has_predicted).sum()) + total_correct
+    total_predicted = float((~alignment.has_gold & alignment.has_predicted).sum()) + total_correct
+    return total_gold, total_predicted, total_correct
 
 def compute_prf(total_gold, total_predicted, total_correct):
     """Compute precision, recall, and F1
@@ -149,36 +252,42 @@ def compute_prf(total_gold, total_predicted, total_correct):
     return (round(precision, 4), round(recall, 4), round(f1_score,4))
 
 
-def evaluate_sense(relation_pairs, valid_senses):
-    sense_alphabet = Alphabet()
-    #for g_relation, _ in relation_pairs:
-        #if g_relation is not None:
-            #sense = g_relation['Sense'][0]
-            #if sense in valid_senses:
-                #sense_alphabet.add(sense)
+def evaluate_sense(alignment, valid_senses):
+    """Sense confusion matrix of the relation alignment
+
+    A gold relation aligned to nothing counts as
+    ConfusionMatrix.NEGATIVE_CLASS predicted, and a predicted relation
+    aligned to nothing as ConfusionMatrix.NEGATIVE_CLASS in the gold standard.
+    Gold relations whose sense is not valid are left out.
+    """
+    numpy = _numpy()
+    confusion_matrix = _confusion_matrix()
+    sense_alphabet = confusion_matrix.Alphabet()
     for sense in valid_senses:
         sense_alphabet.add(sense)
 
-    sense_alphabet.add(ConfusionMatrix.NEGATIVE_CLASS)
+    sense_alphabet.add(confusion_matrix.ConfusionMatrix.NEGATIVE_CLASS)
     sense_alphabet.growing = False
 
-    sense_cm = ConfusionMatrix(sense_alphabet)
-    for g_relation, p_relation in relation_pairs:
-        assert g_relation is not None or p_relation is not None
-        if g_relation is None:
-            predicted_sense = p_relation['Sense'][0]
-            sense_cm.add(predicted_sense, ConfusionMatrix.NEGATIVE_CLASS)
-        elif p_relation is None:
-            gold_sense = g_relation['Sense'][0]
-            if gold_sense in valid_senses:
-                sense_cm.add(ConfusionMatrix.NEGATIVE_CLASS, gold_sense)
-        else:
-            predicted_sense = p_relation['Sense'][0]
-            gold_sense = g_relation['Sense'][0]
-            if gold_sense in valid_senses:
-                sense_cm.add(predicted_sense, gold_sense)
+    sense_cm = confusion_matrix.ConfusionMatrix(sense_alphabet)
+    negative_index = sense_alphabet.get_index(confusion_matrix.ConfusionMatrix.NEGATIVE_CLASS)
+    valid_sense_set = set(valid_senses)
+    gold_senses = alignment.senses(alignment.gold_indices, alignment.gold_list)
+    predicted_senses = alignment.senses(alignment.predicted_indices, alignment.predicted_list)
+    counted = numpy.array([x is None or x in valid_sense_set for x in gold_senses], dtype=bool)
+    gold_index = numpy.array([sense_alphabet.get_index(x) if x is not None else negative_index
+        for x in gold_senses], dtype=numpy.int64)
+    predicted_index = numpy.array([_sense_index(sense_alphabet, x) if c and x is not None
+        else negative_index for x, c in zip(predicted_senses, counted)], dtype=numpy.int64)
+    numpy.add.at(sense_cm.matrix, (predicted_index[counted], gold_index[counted]), 1)
     return sense_cm
 
+def _sense_index(sense_alphabet, sense):
+    if not sense_alphabet.has_label(sense):
+        # as ConfusionMatrix.add does for a label the alphabet does not have
+        sense_alphabet.add(sense)
+    return sense_alphabet.get_index(sense)
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -186,24 +295,61 @@ def main():
     parser.add_argument('--cutoff', help='Cutoff value for partial matching', default=0.7, type=float)
     parser.add_argument('gold', help='Gold standard file')
     parser.add_argument('predicted', help='System output file')
+    parser.add_argument('--max-search-states', type=float,
+        help='Align the documents whose estimated number of alignment search states '
+            'exceeds this greedily instead of exactly')
+    parser.add_argument('--doc-id', action='append', dest='doc_ids', metavar='DOC_ID',
+        help='Evaluate only this document (can be repeated). Only its relations are '
+            'read, through a byte-offset index saved next to each file')
+    parser.add_argument('--sense-level', action='append', type=int, dest='sense_levels',
+        metavar='LEVEL', help='Also score the senses at this level of the sense hierarchy, '
+            'e.g. 1 for Contingency (can be repeated)')
+    parser.add_argument('--alignment-cache', default=DEFAULT_CACHE_DIR, metavar='DIR',
+        help='Directory in which alignments are saved and reused (default: %(default)s)')
+    parser.add_argument('--no-alignment-cache', action='store_true',
+        help='Always align from scratch and do not save the alignments')
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    gold_list = [json.loads(x) for x in open(args.gold)]
-    predicted_list = [json.loads(x) for x in open(args.predicted)]
+    start_profile(args)
+    import alignment_complexity
+    alignment_cache = None
+    if not args.no_alignment_cache:
+        alignment_cache = AlignmentCache(args.alignment_cache)
+    with PROFILER.phase('json loading'):
+        if args.doc_ids:
+            gold_list, predicted_list = load_document_relations(
+                args.gold, args.predicted, args.doc_ids)
+        else:
+            gold_list, predicted_list = load_gold_and_predicted(args.gold, args.predicted)
+    bounded_doc_ids = None
+    if args.max_search_states is not None:
+        with PROFILER.phase('alignment complexity estimation'):
+            doc_complexities = alignment_complexity.estimate_alignment_complexity(
+                gold_list, predicted_list)
+            bounded_doc_ids = alignment_complexity.select_bounded_doc_ids(
+                doc_complexities, args.max_search_states)
+        if len(bounded_doc_ids) > 0:
+            print 'Aligning %s documents greedily: %s' % \
+                (len(bounded_doc_ids), ' '.join(sorted(bounded_doc_ids)))
     print '\n================================================'
     print 'Evaluation for all discourse relations'
-    partial_evaluate(gold_list, predicted_list, args.cutoff)
+    partial_evaluate(gold_list, predicted_list, args.cutoff, bounded_doc_ids, alignment_cache,
+        args.sense_levels)
 
     print '\n================================================'
     print 'Evaluation for explicit discourse relations only'
     explicit_gold_list = [x for x in gold_list if x['Type'] == 'Explicit']
     explicit_predicted_list = [x for x in predicted_list if x['Type'] == 'Explicit']
-    partial_evaluate(explicit_gold_list, explicit_predicted_list, args.cutoff)
+    partial_evaluate(explicit_gold_list, explicit_predicted_list, args.cutoff,
+        bounded_doc_ids, alignment_cache, args.sense_levels)
 
     print '\n================================================'
     print 'Evaluation for non-explicit discourse relations only (Implicit, EntRel, AltLex)'
     non_explicit_gold_list = [x for x in gold_list if x['Type'] != 'Explicit']
     non_explicit_predicted_list = [x for x in predicted_list if x['Type'] != 'Explicit']
-    partial_evaluate(non_explicit_gold_list, non_explicit_predicted_list, args.cutoff)
+    partial_evaluate(non_explicit_gold_list, non_explicit_predicted_list, args.cutoff,
+        bounded_doc_ids, alignment_cache, args.sense_levels)
+    finish_profile(args)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Lightweight per-phase timers and counters for evaluation runs
+
+The scorers time their phases and count their work through the module-level
+PROFILER, which is disabled unless a script is run with --profile. When it is
+disabled, phase() hands back a shared do-nothing context manager and count()
+returns immediately, so the instrumentation costs next to nothing.
+
+    with PROFILER.phase('alignment'):
+        ...
+    PROFILER.count('pairs compared', len(gold_list) * len(predicted_list))
+"""
+import json
+import os
+import threading
+from timeit import default_timer
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler._record(self.name, self.start_time, default_timer())
+        return False
+
+
+class Profiler(object):
+    """Collect wall time per phase and counters of work done"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.phase_seconds = {}
+        self.phase_calls = {}
+        self.counters = {}
+        self.events = []
+        self.origin = default_timer()
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def phase(self, name):
+        """Context manager that times the enclosed block as phase name"""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """Add n to the counter name"""
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def _record(self, name, start_time, end_time):
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + end_time - start_time
+        self.phase_calls[name] = self.phase_calls.get(name, 0) + 1
+        self.events.append((name, start_time, end_time, threading.current_thread().ident))
+
+    def to_dict(self):
+        phases = {}
+        for name in self.phase_seconds:
+            phases[name] = {'seconds': self.phase_seconds[name],
+                'calls': self.phase_calls[name]}
+        return {'phases': phases, 'counters': dict(self.counters)}
+
+    def write_json(self, file_name):
+        json.dump(self.to_dict(), open(file_name, 'w'), indent=2, sort_keys=True)
+
+    def write_chrome_trace(self, file_name):
+        """Write the phases in the Chrome trace event format
+
+        The file can be opened in chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        trace_events = []
+        for name, start_time, end_time, tid in self.events:
+            trace_events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': (start_time - self.origin) * 1e6,
+                'dur': (end_time - start_time) * 1e6})
+        for name in sorted(self.counters):
+            trace_events.append({'name': name, 'ph': 'C', 'pid': pid, 'tid': 0,
+                'ts': (default_timer() - self.origin) * 1e6,
+                'args': {'value': self.counters[name]}})
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'},
+            open(file_name, 'w'))
+
+    def print_summary(self):
+        print 'Profile --------------'
+        for name in sorted(self.phase_seconds, key=lambda x: -self.phase_seconds[x]):
+            print '%-45s %10.4f sec %6s calls' % \
+                (name, self.phase_seconds[name], self.phase_calls[name])
+        for name in sorted(self.counters):
+            print '%-45s %10s' % (name, self.counters[name])
+
+
+PROFILER = Profiler()
+
+def add_profile_arguments(parser):
+    """Add --profile and --profile-trace to an argparse parser"""
+    parser.add_argument('--profile', metavar='FILE',
+        help='Time each phase and write the profile to FILE as JSON')
+    parser.add_argument('--profile-trace', metavar='FILE',
+        help='Also write a Chrome trace event file (requires --profile)')
+
+def start_profile(args):
+    if args.profile is not None:
+        PROFILER.enable()
+
+def finish_profile(args):
+    if args.profile is None:
+        return
+    PROFILER.print_summary()
+    PROFILER.write_json(args.profile)
+    if args.profile_trace is not None:
+        PROFILER.write_chrome_trace(args.profile_trace)
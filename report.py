@@ -1,32 +1,138 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""Generate tsv format files from a directory of result zip files 
+"""Generate tsv format files from a directory of result zip files
 
 CoNLL 2016 Shared Task results are downloaded from TIRA and sent to
 participants. This script generates tsv file that summarizes all zip files
 in the same directory
 
 python report.py dir_with_zip_files > result_table.tsv
+
+The zip files are read in parallel, and the parsed results are cached in
+dir_with_zip_files/.report_cache.json keyed by the path, size, and
+modification time of each zip file, so only new or changed zip files are
+opened when the table is regenerated. When a run has an evaluation.json next to
+its evaluation.prototext, the measures are taken from it instead of being
+scraped from the prototext. The columns are the union of the keys
+found in all files; a cell is left empty if a file does not have that key.
+
+results_store.py keeps the results in a SQLite database instead and exports
+the same table with "python results_store.py results.db export".
 """
-import zipfile
+import argparse
 import glob
+import json
+import os
 import re
-import sys
+import zipfile
+from multiprocessing import Pool
 
-def main(dir_name):
-    file_names = glob.glob('%s/*.zip' % dir_name)
-    first = True
-    for file_name in file_names:
-        z = zipfile.ZipFile(file_name)
-        for x in z.namelist():
-            if 'evaluation.prototext' in x:
+from results_writer import load_measures
+
+RESULT_PATTERN = re.compile('key: "([^"]+)" \n value: "([^"]+)"')
+CACHE_FILE_NAME = '.report_cache.json'
+
+def read_results(file_name):
+    """Read every evaluation.prototext in a zip file
+
+    Returns:
+        A list with a list of (key, value) tuples for each prototext
+    """
+    z = zipfile.ZipFile(file_name)
+    names = set(z.namelist())
+    results = []
+    for x in z.namelist():
+        if 'evaluation.prototext' in x:
+            json_name = x.replace('evaluation.prototext', 'evaluation.json')
+            if json_name in names:
+                measures = load_measures(z.open(json_name).read())
+                results.append([(k, str(round(v, 4))) for k, v in measures.items()])
+            else:
                 result_proto = z.open(x).read()
-                result_tuples =  re.findall('key: "([^"]+)" \n value: "([^"]+)"', result_proto)
-                if first:
-                    print '\t'.join(['file'] + [k for k, _ in result_tuples])
-                    first = False
-                print '\t'.join([file_name] + [v for _, v in result_tuples])
+                results.append(RESULT_PATTERN.findall(result_proto))
+    z.close()
+    return results
+
+def file_signature(file_name):
+    stat = os.stat(file_name)
+    return [stat.st_size, stat.st_mtime]
+
+def load_cache(cache_file):
+    if cache_file is None or not os.path.exists(cache_file):
+        return {}
+    try:
+        return json.load(open(cache_file))
+    except ValueError:
+        return {}
+
+def save_cache(cache, cache_file):
+    if cache_file is None:
+        return
+    tmp_file = cache_file + '.tmp'
+    json.dump(cache, open(tmp_file, 'w'))
+    os.rename(tmp_file, cache_file)
+
+def collect_results(file_names, cache_file=None, processes=None):
+    """Read the results of all zip files, reusing the cached ones
+
+    Returns:
+        A list of (file name, list of (key, value) tuples), one for each
+        evaluation.prototext found
+    """
+    cache = load_cache(cache_file)
+    signatures = dict((x, file_signature(x)) for x in file_names)
+    stale_file_names = [x for x in file_names
+        if x not in cache or cache[x]['signature'] != signatures[x]]
+    if len(stale_file_names) > 1 and processes != 1:
+        pool = Pool(processes)
+        stale_results = pool.map(read_results, stale_file_names)
+        pool.close()
+        pool.join()
+    else:
+        stale_results = [read_results(x) for x in stale_file_names]
+
+    for file_name, results in zip(stale_file_names, stale_results):
+        cache[file_name] = {'signature': signatures[file_name], 'results': results}
+    for file_name in list(cache.keys()):
+        if file_name not in signatures:
+            del cache[file_name]
+    if len(stale_file_names) > 0 or len(cache) != len(file_names):
+        save_cache(cache, cache_file)
+
+    rows = []
+    for file_name in file_names:
+        for result_tuples in cache[file_name]['results']:
+            rows.append((file_name, [tuple(x) for x in result_tuples]))
+    return rows
+
+def union_keys(rows):
+    """All keys in the order in which they first appear"""
+    keys = []
+    seen = set()
+    for _, result_tuples in rows:
+        for k, _ in result_tuples:
+            if k not in seen:
+                seen.add(k)
+                keys.append(k)
+    return keys
+
+def main(dir_name, cache_file=None, processes=None):
+    file_names = sorted(glob.glob('%s/*.zip' % dir_name))
+    rows = collect_results(file_names, cache_file, processes)
+    keys = union_keys(rows)
+    print '\t'.join(['file'] + keys)
+    for file_name, result_tuples in rows:
+        result_dict = dict(result_tuples)
+        print '\t'.join([file_name] + [result_dict.get(k, '') for k in keys])
 
 if __name__ == '__main__':
-    dir_name = sys.argv[1] 
-    main(dir_name)
+    parser = argparse.ArgumentParser(
+        description='Summarize a directory of TIRA result zip files as a tsv table')
+    parser.add_argument('dir_name', help='Directory with the result zip files')
+    parser.add_argument('--processes', type=int,
+        help='Number of processes reading zip files (default: number of CPUs)')
+    parser.add_argument('--no-cache', action='store_true',
+        help='Do not read or write %s' % CACHE_FILE_NAME)
+    args = parser.parse_args()
+    cache_file = None if args.no_cache else os.path.join(args.dir_name, CACHE_FILE_NAME)
+    main(args.dir_name, cache_file, args.processes)
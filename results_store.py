@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""SQLite store of evaluation results
+
+The scorers can record their results in a SQLite database instead of, or in
+addition to, evaluation.prototext (tira_eval.py --store results.db, scorer.py
+--store results.db). For each run the database has
+
+    runs            name, team, dataset, time of the run, and where it came from
+    metrics         every measure, e.g. "All Parser f1"
+    sense_counts    gold, predicted, and correct counts of every sense
+    doc_counts      gold, predicted, and correct counts of every document
+
+The indexes serve leaderboards (best runs by a metric), the runs of a team,
+and a metric over time. Results that only exist as TIRA zip files can be
+imported, and the TSV table of report.py is exported with one query:
+
+python results_store.py results.db import-zips dir_with_zip_files
+python results_store.py results.db export > result_table.tsv
+python results_store.py results.db leaderboard "All Parser f1"
+python results_store.py results.db history "All Parser f1" --team myteam
+"""
+import argparse
+import os
+import sys
+import time
+
+SCHEMA_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    team TEXT,
+    dataset TEXT,
+    created REAL NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, key)
+);
+CREATE TABLE IF NOT EXISTS sense_counts (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    evaluation TEXT NOT NULL,
+    sense TEXT NOT NULL,
+    gold REAL NOT NULL,
+    predicted REAL NOT NULL,
+    correct REAL NOT NULL,
+    PRIMARY KEY (run_id, evaluation, sense)
+);
+CREATE TABLE IF NOT EXISTS doc_counts (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    evaluation TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    gold REAL NOT NULL,
+    predicted REAL NOT NULL,
+    correct REAL NOT NULL,
+    PRIMARY KEY (run_id, evaluation, doc_id, metric)
+);
+CREATE INDEX IF NOT EXISTS metrics_by_key_value ON metrics (key, value);
+CREATE INDEX IF NOT EXISTS runs_by_team_created ON runs (team, created);
+CREATE INDEX IF NOT EXISTS runs_by_created ON runs (created);
+CREATE UNIQUE INDEX IF NOT EXISTS runs_by_source ON runs (source);
+CREATE INDEX IF NOT EXISTS doc_counts_by_doc ON doc_counts (doc_id, metric);
+'''
+
+def format_value(value):
+    """Format a measure the way evaluation.prototext does"""
+    return str(round(value, 4))
+
+
+class ResultsStore(object):
+    """Read and write evaluation results in a SQLite database"""
+
+    def __init__(self, db_file):
+        import sqlite3
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, name, measures, team=None, dataset=None, created=None,
+            source=None, evaluations=None, doc_scores=None):
+        """Record one run
+
+        Input:
+            measures : a list of (key, value) measures in report order
+            evaluations : the 'evaluations' part of ResultsWriter.to_dict()
+                (confusion matrices give the per-sense counts)
+            doc_scores : a scorer.DocumentScores of the evaluation of all
+                relations
+            source : where the results come from; a run with the same source
+                replaces the earlier one
+
+        Returns:
+            The run_id of the new run
+        """
+        if created is None:
+            created = time.time()
+        with self.connection:
+            if source is not None:
+                self.connection.execute('DELETE FROM runs WHERE source = ?', (source,))
+            cursor = self.connection.execute(
+                'INSERT INTO runs (name, team, dataset, created, source) VALUES (?, ?, ?, ?, ?)',
+                (name, team, dataset, created, source))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO metrics (run_id, position, key, value) VALUES (?, ?, ?, ?)',
+                [(run_id, i, key, float(value)) for i, (key, value) in enumerate(measures)])
+            if evaluations is not None:
+                self.connection.executemany(
+                    'INSERT INTO sense_counts VALUES (?, ?, ?, ?, ?, ?)',
+                    [(run_id,) + x for x in _sense_count_rows(evaluations)])
+            if doc_scores is not None:
+                rows = []
+                for doc_id, doc_counts in doc_scores.counts.items():
+                    for metric, (gold, predicted, correct) in doc_counts.items():
+                        rows.append((run_id, 'All', doc_id, metric, gold, predicted, correct))
+                self.connection.executemany(
+                    'INSERT INTO doc_counts VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        return run_id
+
+    def add_results_writer(self, name, results_writer, **kwargs):
+        """Record the results collected by a results_writer.ResultsWriter"""
+        return self.add_run(name, results_writer.measures.items(),
+            evaluations=results_writer.evaluations, **kwargs)
+
+    def leaderboard(self, key, limit=10, dataset=None):
+        """The runs with the highest value of a measure
+
+        Returns:
+            A list of (name, team, created, value)
+        """
+        query = '''SELECT runs.name, runs.team, runs.created, metrics.value
+            FROM metrics JOIN runs ON runs.run_id = metrics.run_id
+            WHERE metrics.key = ?'''
+        parameters = [key]
+        if dataset is not None:
+            query += ' AND runs.dataset = ?'
+            parameters.append(dataset)
+        query += ' ORDER BY metrics.value DESC LIMIT ?'
+        parameters.append(limit)
+        return self.connection.execute(query, parameters).fetchall()
+
+    def team_runs(self, team):
+        """The runs of a team, oldest first, as (run_id, name, dataset, created)"""
+        return self.connection.execute('''SELECT run_id, name, dataset, created
+            FROM runs WHERE team = ? ORDER BY created''', (team,)).fetchall()
+
+    def metric_history(self, key, team=None):
+        """A measure over time as (created, name, team, value)"""
+        query = '''SELECT runs.created, runs.name, runs.team, metrics.value
+            FROM runs JOIN metrics ON metrics.run_id = runs.run_id AND metrics.key = ?'''
+        parameters = [key]
+        if team is not None:
+            query += ' WHERE runs.team = ?'
+            parameters.append(team)
+        query += ' ORDER BY runs.created'
+        return self.connection.execute(query, parameters).fetchall()
+
+    def export_tsv(self, output=sys.stdout):
+        """Write the table of report.py: one row per run, one column per
+        measure, in the order in which the measures first appear"""
+        rows = self.connection.execute('''SELECT runs.run_id, runs.name, metrics.key, metrics.value
+            FROM runs JOIN metrics ON metrics.run_id = runs.run_id
+            ORDER BY runs.name, runs.run_id, metrics.position''')
+        keys = []
+        seen = set()
+        runs = []
+        for run_id, name, key, value in rows:
+            if len(runs) == 0 or runs[-1][0] != run_id:
+                runs.append((run_id, name, {}))
+            runs[-1][2][key] = value
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+        output.write('\t'.join(['file'] + keys) + '\n')
+        for _, name, values in runs:
+            output.write('\t'.join([name] + [format_value(values[k]) if k in values else ''
+                for k in keys]) + '\n')
+
+    def import_zips(self, dir_name, team=None, dataset=None):
+        """Record the results in a directory of TIRA result zip files
+
+        A zip file is imported again only if it changed since the last import.
+
+        Returns:
+            The number of runs imported
+        """
+        import glob
+        from report import read_results
+        num_imported = 0
+        for file_name in sorted(glob.glob('%s/*.zip' % dir_name)):
+            modified = os.path.getmtime(file_name)
+            for i, result_tuples in enumerate(read_results(file_name)):
+                source = '%s#%s' % (os.path.abspath(file_name), i)
+                known = self.connection.execute(
+                    'SELECT created FROM runs WHERE source = ?', (source,)).fetchone()
+                if known is not None and known[0] == modified:
+                    continue
+                self.add_run(file_name, [(k, float(v)) for k, v in result_tuples],
+                    team=team, dataset=dataset, created=modified, source=source)
+                num_imported += 1
+        return num_imported
+
+def _confusion_matrix():
+    """The confusion_matrix module, imported on first use as it loads NumPy"""
+    import confusion_matrix
+    return confusion_matrix
+
+def _sense_count_rows(evaluations):
+    """(evaluation, sense, gold, predicted, correct) from the sense confusion
+    matrices of ResultsWriter.evaluations"""
+    negative = _confusion_matrix().ConfusionMatrix.NEGATIVE_CLASS
+    rows = []
+    for evaluation, details in evaluations.items():
+        cm = details['confusion_matrices'].get('Sense')
+        if cm is None:
+            continue
+        matrix = cm['matrix']
+        for i, sense in enumerate(cm['labels']):
+            if sense == negative:
+                continue
+            predicted = sum(matrix[i])
+            gold = sum(row[i] for row in matrix)
+            rows.append((evaluation, sense, gold, predicted, matrix[i][i]))
+    return rows
+
+def add_store_arguments(parser):
+    """Add --store, --run-name, --team, and --dataset-name to an argparse parser"""
+    parser.add_argument('--store', metavar='DB',
+        help='Also record the results in this SQLite results store')
+    parser.add_argument('--run-name', help='Name of the run in the store (default: the system output path)')
+    parser.add_argument('--team', help='Team of the run in the store')
+    parser.add_argument('--dataset-name', help='Dataset of the run in the store')
+
+def store_results(args, default_name, results_writer, doc_scores=None):
+    """Record the results if --store was given"""
+    if args.store is None:
+        return
+    store = ResultsStore(args.store)
+    store.add_results_writer(args.run_name or default_name, results_writer,
+        team=args.team, dataset=args.dataset_name, doc_scores=doc_scores)
+    store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Query and export the SQLite results store')
+    parser.add_argument('db_file', help='SQLite results store')
+    subparsers = parser.add_subparsers(dest='command')
+    import_parser = subparsers.add_parser('import-zips',
+        help='Import a directory of TIRA result zip files')
+    import_parser.add_argument('dir_name')
+    import_parser.add_argument('--team')
+    import_parser.add_argument('--dataset')
+    subparsers.add_parser('export', help='Print the results as a tsv table like report.py')
+    leaderboard_parser = subparsers.add_parser('leaderboard', help='Best runs by a measure')
+    leaderboard_parser.add_argument('key', help='Measure, e.g. "All Parser f1"')
+    leaderboard_parser.add_argument('--limit', type=int, default=10)
+    leaderboard_parser.add_argument('--dataset')
+    history_parser = subparsers.add_parser('history', help='A measure over time')
+    history_parser.add_argument('key')
+    history_parser.add_argument('--team')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db_file)
+    if args.command == 'import-zips':
+        print >> sys.stderr, 'Imported %s runs' % \
+            store.import_zips(args.dir_name, args.team, args.dataset)
+    elif args.command == 'export':
+        store.export_tsv()
+    elif args.command == 'leaderboard':
+        for name, team, created, value in store.leaderboard(args.key, args.limit, args.dataset):
+            print '%s\t%s\t%s\t%s' % (format_value(value), name, team or '',
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(created)))
+    elif args.command == 'history':
+        for created, name, team, value in store.metric_history(args.key, args.team):
+            print '%s\t%s\t%s\t%s' % (time.strftime('%Y-%m-%d %H:%M', time.localtime(created)),
+                format_value(value), name, team or '')
+    store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Machine-readable evaluation results
+
+The TIRA evaluators write evaluation.prototext with the headline measures
+rounded to four digits. Alongside it, ResultsWriter writes evaluation.json
+with the same measures at full precision, the raw counts behind them, and the
+confusion matrices, so that the results can be aggregated and any derived
+metric recomputed without rescoring:
+
+    {
+        "measures": {"All Parser precision": 0.0313, ...},
+        "evaluations": {
+            "All": {
+                "counts": {"Explicit connective": {"gold": 10, "predicted": 8, "correct": 6}, ...},
+                "confusion_matrices": {"Sense": {"labels": [...], "matrix": [[...]]}, ...}
+            },
+            ...
+        }
+    }
+
+The measures can also be written as a two-column CSV file, and in the
+evaluation.prototext format with write_prototext.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+EXACT_MATCH_METRICS = [
+    ('Explicit connective', 0),
+    ('Arg1 extraction', 1),
+    ('Arg2 extraction', 2),
+    ('Arg 1 Arg2 extraction', 3),
+    ]
+
+PARTIAL_MATCH_METRICS = [
+    ('Arg1 extraction', 0, 'Arg1'),
+    ('Arg2 extraction', 1, 'Arg2'),
+    ('Arg 1 Arg2 extraction', 2, 'Arg 1 Arg2'),
+    ]
+
+TOKENWISE_METRICS = [
+    ('Arg1 token-wise extraction', 'Arg1'),
+    ('Arg2 token-wise extraction', 'Arg2'),
+    ('Arg 1 Arg2 token-wise extraction', 'Arg 1 Arg2'),
+    ]
+
+DEFAULT_PARTIAL_CUTOFF = 0.7
+
+def _confusion_matrix():
+    """The confusion_matrix module, imported on first use as it loads NumPy"""
+    import confusion_matrix
+    return confusion_matrix
+
+def partial_match_prefix(prefix, partial_match_cutoff):
+    """The prefix of the partial matching measures of an evaluation, e.g.
+    "All (partial match)", with the cutoff if it is not the default one"""
+    if partial_match_cutoff == DEFAULT_PARTIAL_CUTOFF:
+        return '%s (partial match)' % prefix
+    return '%s (partial match %s)' % (prefix, partial_match_cutoff)
+
+def write_prototext(measures, f):
+    """Write (key, value) measures in the evaluation.prototext format of TIRA"""
+    for key, value in measures:
+        f.write('measure {\n key: "%s" \n value: "%s"\n}\n' % (key, round(value, 4)))
+
+def exact_measures(prefix, result_tuple):
+    """The (key, value) measures of a scorer.evaluate result"""
+    precision, recall, f1 = result_tuple[5:8]
+    measures = [
+        ('%s Parser precision' % prefix, precision),
+        ('%s Parser recall' % prefix, recall),
+        ('%s Parser f1' % prefix, f1),
+        ]
+    for name, position in EXACT_MATCH_METRICS:
+        p, r, f = result_tuple[position].get_prf('yes')
+        measures.append(('%s %s precision' % (prefix, name), p))
+        measures.append(('%s %s recall' % (prefix, name), r))
+        measures.append(('%s %s f1' % (prefix, name), f))
+    return measures
+
+def partial_match_measures(prefix, result_tuple):
+    """The (key, value) measures of a partial_scorer.score_partial result"""
+    precision, recall, f1 = result_tuple[3]
+    measures = [
+        ('%s Parser precision' % prefix, precision),
+        ('%s Parser recall' % prefix, recall),
+        ('%s Parser f1' % prefix, f1),
+        ]
+    for name, position, _ in PARTIAL_MATCH_METRICS:
+        p, r, f = result_tuple[position]
+        measures.append(('%s %s precision' % (prefix, name), p))
+        measures.append(('%s %s recall' % (prefix, name), r))
+        measures.append(('%s %s f1' % (prefix, name), f))
+    tokenwise_prf = result_tuple[4].get('tokenwise_prf', {})
+    for name, prf_key in TOKENWISE_METRICS:
+        if prf_key in tokenwise_prf:
+            p, r, f = tokenwise_prf[prf_key]
+            measures.append(('%s %s precision' % (prefix, name), p))
+            measures.append(('%s %s recall' % (prefix, name), r))
+            measures.append(('%s %s f1' % (prefix, name), f))
+    return measures
+
+def binary_counts(cm):
+    """Gold, predicted, and correct counts of a yes/no ConfusionMatrix"""
+    yes = cm.alphabet.get_index('yes')
+    return {'gold': cm.matrix[:, yes].sum(),
+        'predicted': cm.matrix[yes, :].sum(),
+        'correct': cm.matrix[yes, yes]}
+
+def sense_counts(sense_cm):
+    """Gold, predicted, and correct counts of the parser
+    (the negative class is not counted)"""
+    negative = sense_cm.alphabet.get_index(_confusion_matrix().ConfusionMatrix.NEGATIVE_CLASS)
+    num_classes = sense_cm.alphabet.size()
+    matrix = sense_cm.matrix[:num_classes, :num_classes]
+    correct = matrix.trace()
+    predicted = matrix.sum()
+    gold = matrix.sum()
+    if negative != -1:
+        predicted -= matrix[negative, :].sum()
+        gold -= matrix[:, negative].sum()
+    return {'gold': gold, 'predicted': predicted, 'correct': correct}
+
+
+class ResultsWriter(object):
+    """Collect the results of several evaluations and write them out"""
+
+    def __init__(self):
+        self.measures = OrderedDict()
+        self.evaluations = OrderedDict()
+
+    def add_exact(self, prefix, result_tuple):
+        """Add the result of scorer.evaluate"""
+        self.measures.update(exact_measures(prefix, result_tuple))
+        counts = OrderedDict()
+        confusion_matrices = OrderedDict()
+        counts['Parser'] = sense_counts(result_tuple[4])
+        for name, position in EXACT_MATCH_METRICS:
+            counts[name] = binary_counts(result_tuple[position])
+            confusion_matrices[name] = result_tuple[position].to_dict()
+        confusion_matrices['Sense'] = result_tuple[4].to_dict()
+        self.evaluations[prefix] = {'counts': counts,
+            'confusion_matrices': confusion_matrices}
+
+    def add_partial(self, prefix, result_tuple):
+        """Add the result of partial_scorer.score_partial"""
+        self.measures.update(partial_match_measures(prefix, result_tuple))
+        details = result_tuple[4]
+        counts = OrderedDict()
+        counts['Parser'] = sense_counts(details['sense_cm'])
+        for name, _, count_key in PARTIAL_MATCH_METRICS:
+            gold, predicted, correct = details['counts'][count_key]
+            counts[name] = {'gold': gold, 'predicted': predicted, 'correct': correct}
+        for name, count_key in TOKENWISE_METRICS:
+            if count_key in details.get('tokenwise_counts', {}):
+                gold, predicted, correct = details['tokenwise_counts'][count_key]
+                counts[name] = {'gold': gold, 'predicted': predicted, 'correct': correct}
+        self.evaluations[prefix] = {'counts': counts,
+            'confusion_matrices': {'Sense': details['sense_cm'].to_dict()}}
+
+    def add_score_result(self, score_result):
+        """Add every evaluation of a scoring.ScoreResult"""
+        for prefix, result_tuple in score_result.exact.items():
+            self.add_exact(prefix, result_tuple)
+        for cutoff, partial_results in score_result.partial.items():
+            for prefix, result_tuple in partial_results.items():
+                self.add_partial(partial_match_prefix(prefix, cutoff), result_tuple)
+
+    def to_dict(self):
+        return OrderedDict([('measures', self.measures),
+            ('evaluations', self.evaluations)])
+
+    def write_json(self, file_name):
+        json.dump(self.to_dict(), open(file_name, 'w'), indent=1)
+
+    def write_csv(self, file_name):
+        f = open(file_name, 'wb')
+        writer = csv.writer(f)
+        writer.writerow(['key', 'value'])
+        for key, value in self.measures.items():
+            writer.writerow([key, value])
+        f.close()
+
+def load_measures(json_string):
+    """Read the measures of an evaluation.json in their original order"""
+    return json.loads(json_string, object_pairs_hook=OrderedDict)['measures']
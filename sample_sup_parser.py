@@ -19,11 +19,13 @@ Note that we have to fill in 'Type' field as Explicti and Implicit,
 but that will be overridden by the evaluator. 
 """
 import codecs
+import itertools
 import json
 import random
 import sys
 
-import conll16st.validator
+import validator
+from doc_index import ParseLookup
 
 class DiscourseParser(object):
     """Sample discourse relation sense classifier
@@ -31,32 +33,58 @@ class DiscourseParser(object):
     This simply classifies each instance randomly. 
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.valid_senses = []
 
     def classify_sense(self, data_dir, output_dir, valid_senses):
         relation_file = '%s/relations-no-senses.json' % data_dir
         parse_file = '%s/parses.json' % data_dir
-        parse = json.load(codecs.open(parse_file, encoding='utf8'))
-
-        relation_dicts = [json.loads(x) for x in open(relation_file)]
+        doc_lookup = ParseLookup(parse_file)
+        self.valid_senses = valid_senses
 
         output = codecs.open('%s/output.json' % output_dir, 'wb', encoding ='utf8')
         random.seed(10)
-        for i, relation_dict in enumerate(relation_dicts):
-            sense = valid_senses[random.randint(0, len(valid_senses)-1)]
-            relation_dict['Sense'] = [sense]
-            relation_dict['Arg1']['TokenList'] = \
-                    [x[2] for x in relation_dict['Arg1']['TokenList']]
-            relation_dict['Arg2']['TokenList'] = \
-                    [x[2] for x in relation_dict['Arg2']['TokenList']]
-            relation_dict['Connective']['TokenList'] = \
-                    [x[2] for x in relation_dict['Connective']['TokenList']]
-            if len(relation_dict['Connective']['TokenList']) > 0:
-                relation_dict['Type'] = 'Explicit'
-            else:
-                relation_dict['Type'] = 'Implicit'
-            output.write(json.dumps(relation_dict) + '\n')
+        for relation_dicts in read_batches(relation_file, self.batch_size):
+            senses = self.classify_batch(relation_dicts, doc_lookup)
+            for relation_dict, sense in zip(relation_dicts, senses):
+                relation_dict['Sense'] = [sense]
+                relation_dict['Arg1']['TokenList'] = \
+                        [x[2] for x in relation_dict['Arg1']['TokenList']]
+                relation_dict['Arg2']['TokenList'] = \
+                        [x[2] for x in relation_dict['Arg2']['TokenList']]
+                relation_dict['Connective']['TokenList'] = \
+                        [x[2] for x in relation_dict['Connective']['TokenList']]
+                if len(relation_dict['Connective']['TokenList']) > 0:
+                    relation_dict['Type'] = 'Explicit'
+                else:
+                    relation_dict['Type'] = 'Implicit'
+                output.write(json.dumps(relation_dict) + '\n')
+        output.close()
+        doc_lookup.close()
+
+    def classify_batch(self, relation_dicts, doc_lookup):
+        """Classify the senses of a batch of relations
+
+        Override this method to plug in a real classifier. The batch comes
+        straight from relations-no-senses.json, and doc_lookup[doc_id]
+        returns the parse of a document (loaded from parses.json on demand).
+
+        Returns:
+            A list of senses, one for each relation in the batch
+        """
+        return [self.valid_senses[random.randint(0, len(self.valid_senses)-1)]
+                for _ in relation_dicts]
+
+def read_batches(relation_file, batch_size):
+    """Read the relations in batches of batch_size relations"""
+    lines = open(relation_file)
+    while True:
+        batch = [json.loads(x) for x in itertools.islice(lines, batch_size)]
+        if len(batch) == 0:
+            break
+        yield batch
+    lines.close()
 
 if __name__ == '__main__':
     language = sys.argv[1]
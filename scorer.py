@@ -2,21 +2,117 @@
 # -*- coding: utf-8 -*-
 """The Official CONLL 2016 Shared Task Scorer
 
+NumPy (through confusion_matrix) and the connective head table are only
+loaded when something is scored, so that importing this module and running
+the command line tools stays fast.
 """
 import argparse
 import json
-
-from confusion_matrix import ConfusionMatrix, Alphabet
-from conn_head_mapper import ConnHeadMapper
+from collections import Counter, defaultdict
+
+from doc_index import load_document_relations
+from loader import load_gold_and_predicted
+from profiler import PROFILER, add_profile_arguments, start_profile, finish_profile
+from results_store import add_store_arguments, store_results
+from results_writer import ResultsWriter
+from span import relation_spans
 import validator
 
-CONN_HEAD_MAPPER = ConnHeadMapper()
+_CONN_HEAD_MAPPER = None
+
+def get_conn_head_mapper():
+    """The shared ConnHeadMapper, built on first use"""
+    global _CONN_HEAD_MAPPER
+    if _CONN_HEAD_MAPPER is None:
+        from conn_head_mapper import ConnHeadMapper
+        _CONN_HEAD_MAPPER = ConnHeadMapper()
+    return _CONN_HEAD_MAPPER
+
+def _confusion_matrix():
+    """The confusion_matrix module, imported on first use as it loads NumPy"""
+    import confusion_matrix
+    return confusion_matrix
+
+DOCUMENT_METRICS = [
+    ('connective', 'Conn'),
+    ('arg1', 'Arg1'),
+    ('arg2', 'Arg2'),
+    ('arg12', 'Arg1Arg2'),
+    ('sense', 'Parser'),
+    ]
+
+def evaluate(gold_list, predicted_list, doc_scores=None, sense_levels=None):
+    """Evaluate the system output against the gold standard and print the report
+
+    If doc_scores is a DocumentScores, the outcome of every match is also
+    attributed to its document while scoring. The sense scores at the
+    levels of the sense hierarchy in sense_levels (e.g. [1, 2]) are printed
+    as well; collapse_sense_levels derives them from the returned sense_cm.
+    """
+    with PROFILER.phase('gold indexing'):
+        gold_index = GoldIndex(gold_list)
+    result_tuple = score_exact(gold_index, predicted_list, doc_scores)
+    with PROFILER.phase('report printing'):
+        print_evaluation(*result_tuple[:5])
+        if sense_levels:
+            print_sense_levels(collapse_sense_levels(result_tuple[4], sense_levels))
+    return result_tuple
+
+def score_exact(gold_index, predicted_list, doc_scores=None, predicted_spans=None):
+    """evaluate() against a GoldIndex, without printing anything
+
+    predicted_spans are the span.relation_spans of predicted_list, if known.
+
+    Returns:
+        The tuple of evaluate()
+    """
+    gold_list = gold_index.gold_list
+    if predicted_spans is None:
+        predicted_spans = relation_spans(predicted_list)
+    with PROFILER.phase('exact matching: connectives'):
+        connective_cm = evaluate_connectives(gold_list, predicted_list, doc_scores, gold_index)
+    with PROFILER.phase('exact matching: arguments'):
+        arg1_cm, arg2_cm, rel_arg_cm = evaluate_argument_extractor(
+            gold_list, predicted_list, doc_scores, gold_index, predicted_spans)
+    with PROFILER.phase('sense scoring'):
+        sense_cm = evaluate_sense(gold_list, predicted_list, doc_scores, gold_index=gold_index,
+            predicted_spans=predicted_spans)
+    precision, recall, f1 = sense_cm.compute_micro_average_f1()
+    return connective_cm, arg1_cm, arg2_cm, rel_arg_cm, sense_cm, precision, recall, f1
+
 
-def evaluate(gold_list, predicted_list):
-    connective_cm = evaluate_connectives(gold_list, predicted_list)
-    arg1_cm, arg2_cm, rel_arg_cm = evaluate_argument_extractor(gold_list, predicted_list)
-    sense_cm = evaluate_sense(gold_list, predicted_list)
+class GoldIndex(object):
+    """The gold standard prepared for exact matching
 
+    The argument spans of the gold relations are counted by (DocID, span),
+    the explicit connectives are extracted, and the valid senses and the
+    sense alphabet are worked out once, so that any number of system
+    outputs can be scored against the same gold standard. spans holds the
+    span.relation_spans of gold_list for the partial scorer.
+    """
+
+    def __init__(self, gold_list, valid_senses=None, sense_alphabet=None, spans=None):
+        self.gold_list = gold_list
+        if spans is None:
+            spans = relation_spans(gold_list)
+        self.spans = spans
+        if valid_senses is None:
+            valid_senses = validator.identify_valid_senses(gold_list)
+        self.valid_senses = valid_senses
+        if sense_alphabet is None:
+            sense_alphabet = build_sense_alphabet(gold_list, valid_senses)
+        self.sense_alphabet = sense_alphabet
+        arg1_keys, arg2_keys, arg12_keys = _arg_keys(gold_list, spans)
+        self.arg1_counts = Counter(arg1_keys)
+        self.arg2_counts = Counter(arg2_keys)
+        self.arg12_counts = Counter(arg12_keys)
+        self.arg12_indices = defaultdict(list)
+        for gi, key in enumerate(arg12_keys):
+            self.arg12_indices[key].append(gi)
+        self.connectives = [(x['DocID'], x['Connective']['TokenList'],
+            x['Connective']['RawText']) for x in gold_list if x['Type'] == 'Explicit']
+
+def print_evaluation(connective_cm, arg1_cm, arg2_cm, rel_arg_cm, sense_cm):
     print 'Explicit connectives         : Precision %1.4f Recall %1.4f F1 %1.4f' % connective_cm.get_prf('yes')
     print 'Arg 1 extractor              : Precision %1.4f Recall %1.4f F1 %1.4f' % arg1_cm.get_prf('yes')
     print 'Arg 2 extractor              : Precision %1.4f Recall %1.4f F1 %1.4f' % arg2_cm.get_prf('yes')
@@ -26,46 +122,72 @@ def evaluate(gold_list, predicted_list):
     print 'Overall parser performance --------------'
     precision, recall, f1 = sense_cm.compute_micro_average_f1()
     print 'Precision %1.4f Recall %1.4f F1 %1.4f' % (precision, recall, f1)
-    return connective_cm, arg1_cm, arg2_cm, rel_arg_cm, sense_cm, precision, recall, f1
 
+def parent_sense(sense, level):
+    """The sense at a level of the sense hierarchy, e.g. Contingency.Cause
+    at level 2 for Contingency.Cause.Reason"""
+    return '.'.join(sense.split('.')[:level])
+
+def collapse_sense_levels(sense_cm, levels):
+    """Sense confusion matrices at coarser levels of the sense hierarchy
 
-def evaluate_argument_extractor(gold_list, predicted_list):
+    The rows and columns of the finest-level matrix are added up by parent
+    sense, so no relation is scored again. A predicted sense that the finest
+    level did not know (and counted as ConfusionMatrix.NEGATIVE_CLASS) stays
+    wrong at every level.
+
+    Returns:
+        A list of (level, ConfusionMatrix)
+    """
+    labels = [sense_cm.alphabet.get_label(i) for i in xrange(sense_cm.alphabet.size())]
+    return [(level, sense_cm.collapse(dict((x, parent_sense(x, level)) for x in labels)))
+        for level in levels]
+
+def print_sense_levels(sense_level_cms):
+    for level, sense_cm in sense_level_cms:
+        print 'Sense classification at level %s--------------' % level
+        sense_cm.print_summary()
+
+
+def evaluate_argument_extractor(gold_list, predicted_list, doc_scores=None, gold_index=None,
+        predicted_spans=None):
     """Evaluate argument extractor at Arg1, Arg2, and relation level
 
+    gold_index is the GoldIndex of gold_list, if there is one already.
     """
-    gold_arg1 = [(x['DocID'], x['Arg1']['TokenList']) for x in gold_list]
-    predicted_arg1 = [(x['DocID'], x['Arg1']['TokenList']) for x in predicted_list]
-    arg1_cm = compute_binary_eval_metric(gold_arg1, predicted_arg1, span_exact_matching)
-
-    gold_arg2 = [(x['DocID'], x['Arg2']['TokenList']) for x in gold_list]
-    predicted_arg2 = [(x['DocID'], x['Arg2']['TokenList']) for x in predicted_list]
-    arg2_cm = compute_binary_eval_metric(gold_arg2, predicted_arg2, span_exact_matching)
-
-    gold_arg12 = [(x['DocID'], (x['Arg1']['TokenList'], x['Arg2']['TokenList'])) \
-            for x in gold_list]
-    predicted_arg12 = [(x['DocID'], (x['Arg1']['TokenList'], x['Arg2']['TokenList'])) \
-            for x in predicted_list]
-    rel_arg_cm = compute_binary_eval_metric(gold_arg12, predicted_arg12, spans_exact_matching)
+    if gold_index is None:
+        gold_index = GoldIndex(gold_list)
+    predicted_arg1, predicted_arg2, predicted_arg12 = _arg_keys(predicted_list, predicted_spans)
+    arg1_cm = compute_exact_match_metric(gold_index.arg1_counts, predicted_arg1,
+        doc_scores, 'arg1')
+    arg2_cm = compute_exact_match_metric(gold_index.arg2_counts, predicted_arg2,
+        doc_scores, 'arg2')
+    rel_arg_cm = compute_exact_match_metric(gold_index.arg12_counts, predicted_arg12,
+        doc_scores, 'arg12')
     return arg1_cm, arg2_cm, rel_arg_cm
 
-def evaluate_connectives(gold_list, predicted_list):
+def evaluate_connectives(gold_list, predicted_list, doc_scores=None, gold_index=None):
     """Evaluate connective recognition accuracy for explicit discourse relations
 
     """
-    explicit_gold_list = [(x['DocID'], x['Connective']['TokenList'], x['Connective']['RawText']) \
-            for x in gold_list if x['Type'] == 'Explicit']
+    if gold_index is None:
+        explicit_gold_list = [(x['DocID'], x['Connective']['TokenList'], x['Connective']['RawText']) \
+                for x in gold_list if x['Type'] == 'Explicit']
+    else:
+        explicit_gold_list = gold_index.connectives
     explicit_predicted_list = [(x['DocID'], x['Connective']['TokenList']) \
             for x in predicted_list if x['Type'] == 'Explicit']
     connective_cm = compute_binary_eval_metric(
-            explicit_gold_list, explicit_predicted_list, connective_head_matching)    
+            explicit_gold_list, explicit_predicted_list, connective_head_matching,
+            doc_scores, 'connective')
     return connective_cm
 
 def spans_exact_matching(gold_doc_id_spans, predicted_doc_id_spans):
     """Matching two lists of spans
 
     Input:
-        gold_doc_id_spans : (DocID , a list of lists of tuples of token addresses)
-        predicted_doc_id_spans : (DocID , a list of lists of token indices)
+        gold_doc_id_spans : (DocID , a list of span.Span)
+        predicted_doc_id_spans : (DocID , a list of span.Span)
 
     Returns:
         True if the spans match exactly
@@ -85,19 +207,31 @@ def span_exact_matching(gold_span, predicted_span):
     """Matching two spans
 
     Input:
-        gold_span : a list of tuples :(DocID, list of tuples of token addresses)
-        predicted_span : a list of tuples :(DocID, list of token indices)
+        gold_span : (DocID, span.Span of the gold token addresses)
+        predicted_span : (DocID, span.Span of the predicted token indices)
 
     Returns:
         True if the spans match exactly
     """
-    gold_docID = gold_span[0]
-    predicted_docID = predicted_span[0]
-    if gold_docID != predicted_docID:
-        return False
-    gold_token_indices = [x[2] for x in gold_span[1]]
-    predicted_token_indices = predicted_span[1]
-    return gold_docID == predicted_docID and gold_token_indices == predicted_token_indices
+    return gold_span[0] == predicted_span[0] and gold_span[1] == predicted_span[1]
+
+def _arg_keys(relation_list, spans=None):
+    """The (DocID, span.Span) keys of Arg1 and of Arg2 and the
+    (DocID, (Arg1 span, Arg2 span)) keys of the relations
+
+    spans are the span.relation_spans of relation_list, if known.
+    """
+    if spans is None:
+        spans = relation_spans(relation_list)
+    arg1_keys = []
+    arg2_keys = []
+    arg12_keys = []
+    for relation, (arg1_span, arg2_span) in zip(relation_list, spans):
+        doc_id = relation['DocID']
+        arg1_keys.append((doc_id, arg1_span))
+        arg2_keys.append((doc_id, arg2_span))
+        arg12_keys.append((doc_id, (arg1_span, arg2_span)))
+    return arg1_keys, arg2_keys, arg12_keys
 
 def connective_head_matching(gold_raw_connective, predicted_raw_connective):
     """Matching connectives
@@ -129,29 +263,50 @@ def connective_head_matching(gold_raw_connective, predicted_raw_connective):
     elif not set(predicted_token_list).issubset(set(gold_token_indices)):
         return False
     else:
-        conn_head, indices = CONN_HEAD_MAPPER.map_raw_connective(gold_tokens)
+        conn_head, indices = get_conn_head_mapper().map_raw_connective(gold_tokens)
         gold_head_connective_indices = [gold_token_indices[x] for x in indices]
         return set(gold_head_connective_indices).issubset(set(predicted_token_list))
 
-def evaluate_sense(gold_list, predicted_list):
-    """Evaluate sense classifier
-
-    The label ConfusionMatrix.NEGATIVE_CLASS is for the relations 
-    that are missed by the system
-    because the arguments don't match any of the gold relations.
-    """
-    sense_alphabet = Alphabet()
-    valid_senses = validator.identify_valid_senses(gold_list)
+def build_sense_alphabet(gold_list, valid_senses=None):
+    """The sense labels of the gold standard plus ConfusionMatrix.NEGATIVE_CLASS"""
+    confusion_matrix = _confusion_matrix()
+    if valid_senses is None:
+        valid_senses = validator.identify_valid_senses(gold_list)
+    sense_alphabet = confusion_matrix.Alphabet()
     for relation in gold_list:
         sense = relation['Sense'][0]
         if sense in valid_senses:
             sense_alphabet.add(sense)
 
-    sense_alphabet.add(ConfusionMatrix.NEGATIVE_CLASS)
+    sense_alphabet.add(confusion_matrix.ConfusionMatrix.NEGATIVE_CLASS)
+    return sense_alphabet
+
+def evaluate_sense(gold_list, predicted_list, doc_scores=None,
+        sense_alphabet=None, valid_senses=None, gold_index=None, predicted_spans=None):
+    """Evaluate sense classifier
+
+    The label ConfusionMatrix.NEGATIVE_CLASS is for the relations 
+    that are missed by the system
+    because the arguments don't match any of the gold relations.
 
-    sense_cm = ConfusionMatrix(sense_alphabet)
+    The sense alphabet and the valid senses are derived from gold_list unless
+    they are given, e.g. when a part of the corpus is scored on its own and
+    the confusion matrices have to add up to the one of the whole corpus.
+    The alphabet of a GoldIndex is copied because scoring can add labels to it.
+    """
+    confusion_matrix = _confusion_matrix()
+    negative_class = confusion_matrix.ConfusionMatrix.NEGATIVE_CLASS
+    if gold_index is None:
+        gold_index = GoldIndex(gold_list, valid_senses, sense_alphabet)
+    elif sense_alphabet is None:
+        sense_alphabet = confusion_matrix.Alphabet.from_dict(gold_index.sense_alphabet.to_dict())
+    valid_senses = gold_index.valid_senses
+    if sense_alphabet is None:
+        sense_alphabet = gold_index.sense_alphabet
+
+    sense_cm = confusion_matrix.ConfusionMatrix(sense_alphabet)
     gold_to_predicted_map, predicted_to_gold_map = \
-            _link_gold_predicted(gold_list, predicted_list, spans_exact_matching)
+            _link_gold_predicted(gold_index, predicted_list, predicted_spans)
 
     for i, gold_relation in enumerate(gold_list):
         gold_sense = gold_relation['Sense'][0]
@@ -159,20 +314,24 @@ def evaluate_sense(gold_list, predicted_list):
             if i in gold_to_predicted_map:
                 predicted_sense = gold_to_predicted_map[i]['Sense'][0]
                 if predicted_sense in gold_relation['Sense']:
-                    sense_cm.add(predicted_sense, predicted_sense)
-                else:
-                    if not sense_cm.alphabet.has_label(predicted_sense):
-                        predicted_sense = ConfusionMatrix.NEGATIVE_CLASS
-                    sense_cm.add(predicted_sense, gold_sense)
+                    gold_sense = predicted_sense
+                elif not sense_cm.alphabet.has_label(predicted_sense):
+                    predicted_sense = negative_class
             else:
-                sense_cm.add(ConfusionMatrix.NEGATIVE_CLASS, gold_sense)
+                predicted_sense = negative_class
+            sense_cm.add(predicted_sense, gold_sense)
+            if doc_scores is not None:
+                doc_scores.add_sense(gold_relation['DocID'], predicted_sense, gold_sense)
 
     for i, predicted_relation in enumerate(predicted_list):
         if i not in predicted_to_gold_map:
             predicted_sense = predicted_relation['Sense'][0]
             if not sense_cm.alphabet.has_label(predicted_sense):
-                predicted_sense = ConfusionMatrix.NEGATIVE_CLASS
-            sense_cm.add(predicted_sense, ConfusionMatrix.NEGATIVE_CLASS)
+                predicted_sense = negative_class
+            sense_cm.add(predicted_sense, negative_class)
+            if doc_scores is not None:
+                doc_scores.add_sense(predicted_relation['DocID'], predicted_sense,
+                    negative_class)
     return sense_cm
 
 
@@ -187,80 +346,233 @@ def combine_spans(span1, span2):
     new_span['TokenList'] = span1['TokenList'] + span2['TokenList']
     return new_span
 
-def compute_binary_eval_metric(gold_list, predicted_list, matching_fn):
+def compute_binary_eval_metric(gold_list, predicted_list, matching_fn,
+        doc_scores=None, metric=None):
     """Compute binary evaluation metric
 
+    The items in gold_list and predicted_list start with the DocID. If
+    doc_scores is given, the outcome of each item is counted for its
+    document under metric. Items of different documents never match, so
+    each gold item is only compared with the predicted items of its document.
     """
-    binary_alphabet = Alphabet()
-    binary_alphabet.add('yes')
-    binary_alphabet.add('no')
-    cm = ConfusionMatrix(binary_alphabet)
+    cm = _binary_confusion_matrix()
     matched_predicted = [False for x in predicted_list]
+    predicted_by_doc_id = defaultdict(list)
+    for i, predicted_span in enumerate(predicted_list):
+        predicted_by_doc_id[predicted_span[0]].append((i, predicted_span))
+    num_compared = 0
     for gold_span in gold_list:
         found_match = False
-        for i, predicted_span in enumerate(predicted_list):
+        for i, predicted_span in predicted_by_doc_id.get(gold_span[0], []):
+            num_compared += 1
             if matching_fn(gold_span, predicted_span) and not matched_predicted[i]:
                 cm.add('yes', 'yes')
                 matched_predicted[i] = True
                 found_match = True
+                if doc_scores is not None:
+                    doc_scores.add(gold_span[0], metric, 1, 1, 1)
                 break
         if not found_match:
             cm.add('no', 'yes')
+            if doc_scores is not None:
+                doc_scores.add(gold_span[0], metric, 1, 0, 0)
+    PROFILER.count('pairs compared', num_compared)
     # Predicted span that does not match with any
-    for matched in matched_predicted:
+    for matched, predicted_span in zip(matched_predicted, predicted_list):
         if not matched:
             cm.add('yes', 'no')
+            if doc_scores is not None:
+                doc_scores.add(predicted_span[0], metric, 0, 1, 0)
     return cm
 
+def compute_exact_match_metric(gold_counts, predicted_list, doc_scores=None, metric=None):
+    """compute_binary_eval_metric for items that match when they are equal
 
-def _link_gold_predicted(gold_list, predicted_list, matching_fn):
+    gold_counts is a Counter of the gold items. An item with a key that
+    occurs g times in the gold standard and p times in the system output is
+    correct min(g, p) times, which is what the pairwise search of
+    compute_binary_eval_metric finds, but counting takes linear time.
+    """
+    cm = _binary_confusion_matrix()
+    yes = cm.alphabet.get_index('yes')
+    no = cm.alphabet.get_index('no')
+    predicted_counts = Counter(predicted_list)
+    for key in set(gold_counts) | set(predicted_counts):
+        gold = gold_counts.get(key, 0)
+        predicted = predicted_counts.get(key, 0)
+        correct = min(gold, predicted)
+        cm.matrix[yes, yes] += correct
+        cm.matrix[no, yes] += gold - correct
+        cm.matrix[yes, no] += predicted - correct
+        if doc_scores is not None:
+            doc_scores.add(key[0], metric, gold, predicted, correct)
+    return cm
+
+def _binary_confusion_matrix():
+    confusion_matrix = _confusion_matrix()
+    binary_alphabet = confusion_matrix.Alphabet()
+    binary_alphabet.add('yes')
+    binary_alphabet.add('no')
+    return confusion_matrix.ConfusionMatrix(binary_alphabet)
+
+
+def _link_gold_predicted(gold_index, predicted_list, predicted_spans=None):
     """Link gold standard relations to the predicted relations
 
     A pair of relations are linked when the arg1 and the arg2 match exactly.
     We do this because we want to evaluate sense classification later.
+    When several relations match, the last one is linked.
 
     Returns:
         A tuple of two dictionaries:
-        1) mapping from gold relation index to predicted relation index
-        2) mapping from predicted relation index to gold relation index
+        1) mapping from gold relation index to predicted relation
+        2) mapping from predicted relation index to gold relation
     """
     gold_to_predicted_map = {}
     predicted_to_gold_map = {}
-    gold_arg12_list = [(x['DocID'], (x['Arg1']['TokenList'], x['Arg2']['TokenList']))
-            for x in gold_list]
-    predicted_arg12_list = [(x['DocID'], (x['Arg1']['TokenList'], x['Arg2']['TokenList']))
-            for x in predicted_list]
-    for gi, gold_span in enumerate(gold_arg12_list):
-        for pi, predicted_span in enumerate(predicted_arg12_list):
-            if matching_fn(gold_span, predicted_span):
+    gold_list = gold_index.gold_list
+    for pi, key in enumerate(_arg_keys(predicted_list, predicted_spans)[2]):
+        gold_indices = gold_index.arg12_indices.get(key)
+        if gold_indices:
+            for gi in gold_indices:
                 gold_to_predicted_map[gi] = predicted_list[pi]
-                predicted_to_gold_map[pi] = gold_list[gi]
+            predicted_to_gold_map[pi] = gold_list[gold_indices[-1]]
     return gold_to_predicted_map, predicted_to_gold_map
 
 
+def compute_document_prf(counts):
+    """Precision, recall, and F1 from (gold, predicted, correct) counts"""
+    gold, predicted, correct = counts
+    precision = float(correct) / predicted if predicted > 0 else 1.0
+    recall = float(correct) / gold if gold > 0 else 1.0
+    f1 = 2.0 * precision * recall / (precision + recall) \
+        if precision + recall != 0 else 0.0
+    return (precision, recall, f1)
+
+
+class DocumentScores(object):
+    """Gold, predicted, and correct counts of every metric for every document
+
+    Pass it to evaluate() to collect the counts in the same pass that
+    computes the corpus-level confusion matrices. Sense counts leave out
+    ConfusionMatrix.NEGATIVE_CLASS like the micro-average of the sense
+    confusion matrix does, so they add up to the overall parser score.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(lambda: dict((x, [0, 0, 0]) for x, _ in DOCUMENT_METRICS))
+
+    def add(self, doc_id, metric, gold, predicted, correct):
+        counts = self.counts[doc_id][metric]
+        counts[0] += gold
+        counts[1] += predicted
+        counts[2] += correct
+
+    def add_sense(self, doc_id, predicted_sense, gold_sense):
+        negative = _confusion_matrix().ConfusionMatrix.NEGATIVE_CLASS
+        self.add(doc_id, 'sense', int(gold_sense != negative),
+            int(predicted_sense != negative),
+            int(predicted_sense == gold_sense and gold_sense != negative))
+
+    def errors(self, doc_id, metric):
+        """Number of missed and spurious items, i.e. the error contribution
+        of the document to the metric"""
+        gold, predicted, correct = self.counts[doc_id][metric]
+        return gold + predicted - 2 * correct
+
+    def doc_ids(self, sort_by='sense'):
+        """DocIDs with the largest error contribution to sort_by first"""
+        return sorted(self.counts, key=lambda x: (-self.errors(x, sort_by), x))
+
+    def to_dict(self):
+        result = {}
+        for doc_id, doc_counts in self.counts.items():
+            result[doc_id] = {}
+            for metric, _ in DOCUMENT_METRICS:
+                gold, predicted, correct = doc_counts[metric]
+                precision, recall, f1 = compute_document_prf(doc_counts[metric])
+                result[doc_id][metric] = {'gold': gold, 'predicted': predicted,
+                    'correct': correct, 'precision': precision, 'recall': recall, 'f1': f1}
+        return result
+
+    def print_table(self, sort_by='sense', top=None):
+        """One line per document with correct/gold/predicted and F1 of each metric"""
+        doc_ids = self.doc_ids(sort_by)
+        if top is not None:
+            doc_ids = doc_ids[:top]
+        width = max([len('DocID')] + [len(x) for x in doc_ids])
+        header = '%-*s %6s' % (width, 'DocID', 'errors')
+        for _, name in DOCUMENT_METRICS:
+            header += '  %-15s' % ('%s c/g/p F1' % name)
+        print header.rstrip()
+        for doc_id in doc_ids:
+            line = '%-*s %6s' % (width, doc_id, self.errors(doc_id, sort_by))
+            for metric, _ in DOCUMENT_METRICS:
+                gold, predicted, correct = self.counts[doc_id][metric]
+                f1 = compute_document_prf((gold, predicted, correct))[2]
+                line += '  %-15s' % ('%s/%s/%s %1.4f' % (correct, gold, predicted, f1))
+            print line.rstrip()
+
 def main():
     parser = argparse.ArgumentParser(
         description="Evaluate system's output against the gold standard")
     parser.add_argument('gold', help='Gold standard file')
     parser.add_argument('predicted', help='System output file')
+    parser.add_argument('--doc-id', action='append', dest='doc_ids', metavar='DOC_ID',
+        help='Evaluate only this document (can be repeated). Only its relations are '
+            'read, through a byte-offset index saved next to each file')
+    parser.add_argument('--sense-level', action='append', type=int, dest='sense_levels',
+        metavar='LEVEL', help='Also score the senses at this level of the sense hierarchy, '
+            'e.g. 1 for Contingency (can be repeated)')
+    parser.add_argument('--per-doc', action='store_true',
+        help='Print the scores of every document, worst first')
+    parser.add_argument('--per-doc-sort', default='sense',
+        choices=[x for x, _ in DOCUMENT_METRICS],
+        help='Metric whose errors rank the documents (default: sense)')
+    parser.add_argument('--per-doc-top', type=int,
+        help='Print only this many documents')
+    parser.add_argument('--per-doc-json', help='Write the per-document scores to this file')
+    add_store_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    gold_list = [json.loads(x) for x in open(args.gold)]
-    predicted_list = [json.loads(x) for x in open(args.predicted)]
+    start_profile(args)
+    with PROFILER.phase('json loading'):
+        if args.doc_ids:
+            gold_list, predicted_list = load_document_relations(
+                args.gold, args.predicted, args.doc_ids)
+        else:
+            gold_list, predicted_list = load_gold_and_predicted(args.gold, args.predicted)
     print '\n================================================'
     print 'Evaluation for all discourse relations'
-    evaluate(gold_list, predicted_list)
+    results_writer = ResultsWriter()
+    doc_scores = None
+    if args.per_doc or args.per_doc_json is not None or args.store is not None:
+        doc_scores = DocumentScores()
+    results_writer.add_exact('All',
+        evaluate(gold_list, predicted_list, doc_scores, args.sense_levels))
+    if args.per_doc:
+        print '\n================================================'
+        print 'Evaluation for each document (c/g/p = correct/gold/predicted)'
+        doc_scores.print_table(args.per_doc_sort, args.per_doc_top)
+    if args.per_doc_json is not None:
+        json.dump(doc_scores.to_dict(), open(args.per_doc_json, 'w'), indent=1, sort_keys=True)
 
     print '\n================================================'
     print 'Evaluation for explicit discourse relations only'
     explicit_gold_list = [x for x in gold_list if x['Type'] == 'Explicit']
     explicit_predicted_list = [x for x in predicted_list if x['Type'] == 'Explicit']
-    evaluate(explicit_gold_list, explicit_predicted_list)
+    results_writer.add_exact('Explicit only',
+        evaluate(explicit_gold_list, explicit_predicted_list, sense_levels=args.sense_levels))
 
     print '\n================================================'
     print 'Evaluation for non-explicit discourse relations only (Implicit, EntRel, AltLex)'
     non_explicit_gold_list = [x for x in gold_list if x['Type'] != 'Explicit']
     non_explicit_predicted_list = [x for x in predicted_list if x['Type'] != 'Explicit']
-    evaluate(non_explicit_gold_list, non_explicit_predicted_list)
+    results_writer.add_exact('Non-explicit only',
+        evaluate(non_explicit_gold_list, non_explicit_predicted_list,
+            sense_levels=args.sense_levels))
+    store_results(args, args.predicted, results_writer, doc_scores)
+    finish_profile(args)
 
 if __name__ == '__main__':
     main()
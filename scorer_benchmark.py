@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Scaling benchmark for the scorers
+
+Generates synthetic corpora of increasing size and times scorer.evaluate,
+partial_scorer.partial_evaluate, and aligner.align_relations on each one.
+For each target, we fit the growth exponent of time against the number of
+relations (1.0 is linear, 2.0 is quadratic) and flag superlinear growth.
+Timings can be saved as a baseline and later runs compared against it.
+
+Documents whose alignment search space is larger than --max-search-states
+are aligned greedily (see alignment_complexity.select_bounded_doc_ids), as
+partial_scorer.py does with the same option. Every run also times the same
+sizes on corpora with a fraction of pathological documents
+(--pathological-check), so that a slow path through the bounded alignment
+is flagged as well.
+
+python scorer_benchmark.py --sizes 10,20,40,80 --save-baseline baseline.json
+python scorer_benchmark.py --sizes 10,20,40,80 --baseline baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from timeit import default_timer
+
+import aligner
+import alignment_complexity
+import partial_scorer
+import scorer
+import synthetic_corpus
+
+TARGETS = ['evaluate', 'partial_evaluate', 'align_relations']
+DEFAULT_MAX_SEARCH_STATES = 1e12
+
+class _Silence(object):
+    """Swallow whatever the scorers print while we are timing them"""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+def run_target(target, gold_list, predicted_list, partial_match_cutoff, bounded_doc_ids=None):
+    if target == 'evaluate':
+        scorer.evaluate(gold_list, predicted_list)
+    elif target == 'partial_evaluate':
+        partial_scorer.partial_evaluate(gold_list, predicted_list, partial_match_cutoff,
+            bounded_doc_ids)
+    elif target == 'align_relations':
+        aligner.align_relations(gold_list, predicted_list, partial_match_cutoff,
+            bounded_doc_ids)
+
+def time_target(target, gold_list, predicted_list, partial_match_cutoff, repeat,
+        bounded_doc_ids=None):
+    """Best time out of repeat runs"""
+    best = None
+    for _ in range(repeat):
+        with _Silence():
+            start_time = default_timer()
+            run_target(target, gold_list, predicted_list, partial_match_cutoff,
+                bounded_doc_ids)
+            elapsed = default_timer() - start_time
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def growth_exponent(sizes, timings):
+    """Least-squares slope of log(time) against log(size)"""
+    points = [(math.log(s), math.log(t)) for s, t in zip(sizes, timings) if t > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if denominator == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+def run_benchmark(sizes, relations_per_doc=20, span_length=15,
+        overlap_density=0.2, pathological_docs=0.0, partial_match_cutoff=0.7,
+        repeat=3, targets=TARGETS, max_exponent=1.25,
+        max_search_states=DEFAULT_MAX_SEARCH_STATES):
+    """Time every target on corpora of the given numbers of documents
+
+    The documents above max_search_states are aligned greedily; None aligns
+    every document with the exact search.
+
+    Returns:
+        A dictionary with the timings and the growth exponent of each target
+    """
+    results = {'sizes': [], 'targets': {}}
+    for target in targets:
+        results['targets'][target] = {'timings': []}
+    for num_docs in sizes:
+        gold_list, predicted_list = synthetic_corpus.generate_corpus(
+            num_docs, relations_per_doc, span_length, overlap_density,
+            pathological_docs, seed=num_docs)
+        bounded_doc_ids = None
+        if max_search_states is not None:
+            bounded_doc_ids = alignment_complexity.select_bounded_doc_ids(
+                alignment_complexity.estimate_alignment_complexity(gold_list, predicted_list),
+                max_search_states)
+        results['sizes'].append({'num_docs': num_docs,
+            'num_gold': len(gold_list), 'num_predicted': len(predicted_list),
+            'num_bounded': len(bounded_doc_ids or [])})
+        for target in targets:
+            elapsed = time_target(target, gold_list, predicted_list,
+                partial_match_cutoff, repeat, bounded_doc_ids)
+            results['targets'][target]['timings'].append(elapsed)
+
+    num_relations = [x['num_gold'] + x['num_predicted'] for x in results['sizes']]
+    for target in targets:
+        target_result = results['targets'][target]
+        exponent = growth_exponent(num_relations, target_result['timings'])
+        target_result['growth_exponent'] = exponent
+        target_result['superlinear'] = exponent is not None and exponent > max_exponent
+    return results
+
+def compare_to_baseline(results, baseline, tolerance):
+    """List (target, num_docs, baseline time, time) that got slower than
+    the baseline by more than the tolerance"""
+    regressions = []
+    for target, target_result in results['targets'].items():
+        if target not in baseline['targets']:
+            continue
+        baseline_timings = dict(zip(
+            [x['num_docs'] for x in baseline['sizes']],
+            baseline['targets'][target]['timings']))
+        for size, elapsed in zip(results['sizes'], target_result['timings']):
+            baseline_time = baseline_timings.get(size['num_docs'])
+            if baseline_time is not None and elapsed > baseline_time * (1.0 + tolerance):
+                regressions.append((target, size['num_docs'], baseline_time, elapsed))
+    return regressions
+
+def print_results(results):
+    sizes = results['sizes']
+    print '%-18s %s' % ('# docs', '\t'.join('%10s' % x['num_docs'] for x in sizes))
+    print '%-18s %s' % ('# relations', '\t'.join(
+        '%10s' % (x['num_gold'] + x['num_predicted']) for x in sizes))
+    print '%-18s %s' % ('# greedy docs', '\t'.join('%10s' % x['num_bounded'] for x in sizes))
+    for target in sorted(results['targets']):
+        target_result = results['targets'][target]
+        exponent = target_result['growth_exponent']
+        print '%-18s %s\tgrowth %s%s' % (target,
+            '\t'.join('%10.4f' % t for t in target_result['timings']),
+            'n/a' if exponent is None else '%1.2f' % exponent,
+            ' SUPERLINEAR' if target_result['superlinear'] else '')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scorers on synthetic corpora')
+    parser.add_argument('--sizes', default='10,20,40,80',
+        help='Comma-separated numbers of documents')
+    parser.add_argument('--relations-per-doc', default=20, type=int)
+    parser.add_argument('--span-length', default=15, type=int)
+    parser.add_argument('--overlap-density', default=0.2, type=float)
+    parser.add_argument('--pathological-docs', default=0.0, type=float)
+    parser.add_argument('--pathological-check', default=0.1, type=float,
+        help='Also time the sizes with this fraction of pathological documents (0 to skip)')
+    parser.add_argument('--max-search-states', default=DEFAULT_MAX_SEARCH_STATES, type=float,
+        help='Align the documents above this search space bound greedily')
+    parser.add_argument('--cutoff', default=0.7, type=float,
+        help='Cutoff value for partial matching')
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--targets', default=','.join(TARGETS),
+        help='Comma-separated subset of %s' % ', '.join(TARGETS))
+    parser.add_argument('--max-exponent', default=1.25, type=float,
+        help='Growth exponent above which a target is flagged as superlinear')
+    parser.add_argument('--baseline', help='Compare against timings saved in this file')
+    parser.add_argument('--tolerance', default=0.2, type=float,
+        help='Allowed slowdown relative to the baseline')
+    parser.add_argument('--save-baseline', help='Save the timings to this file')
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(',')]
+    targets = [x for x in args.targets.split(',') if x in TARGETS]
+    runs = [('corpus', args.pathological_docs)]
+    if args.pathological_check > 0:
+        runs.append(('pathological', args.pathological_check))
+    all_results = {}
+    for name, pathological_docs in runs:
+        print '%s with %s pathological documents' % (name, pathological_docs)
+        all_results[name] = run_benchmark(sizes, args.relations_per_doc, args.span_length,
+            args.overlap_density, pathological_docs, args.cutoff, args.repeat,
+            targets, args.max_exponent, args.max_search_states)
+        print_results(all_results[name])
+    if args.save_baseline is not None:
+        json.dump(all_results, open(args.save_baseline, 'w'), indent=2, sort_keys=True)
+
+    failed = any(x['superlinear'] for results in all_results.values()
+        for x in results['targets'].values())
+    if args.baseline is not None:
+        baseline = json.load(open(args.baseline))
+        for name, results in sorted(all_results.items()):
+            if name not in baseline:
+                continue
+            regressions = compare_to_baseline(results, baseline[name], args.tolerance)
+            for target, num_docs, baseline_time, elapsed in regressions:
+                print 'REGRESSION %s on %s docs (%s): %1.4f sec (baseline %1.4f sec)' % \
+                    (target, num_docs, name, elapsed, baseline_time)
+            failed = failed or len(regressions) > 0
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
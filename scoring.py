@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Library interface to the scorers
+
+scorer.evaluate and partial_scorer.partial_evaluate print their reports and
+prepare the gold standard again on every call. A Scorer prepares the gold
+standard once and scores any number of system outputs without printing
+anything, e.g. in a parameter search:
+
+    from scoring import Scorer
+    gold_scorer = Scorer(gold_relations)
+    for predicted_relations in system_outputs:
+        result = gold_scorer.score(predicted_relations, partial_cutoffs=[0.7])
+        precision, recall, f1 = result.prf('All')
+
+The ScoreResult is rendered separately: print_score_result prints the report
+of tira_eval.py, results_writer.write_prototext writes its measures() to
+evaluation.prototext, and ResultsWriter.add_score_result collects them for
+evaluation.json.
+"""
+from collections import OrderedDict
+
+from profiler import PROFILER
+from results_writer import exact_measures, partial_match_measures, partial_match_prefix
+from span import relation_spans
+
+SUBSETS = [
+    ('All', 'Evaluation for all discourse relations',
+        lambda x: True),
+    ('Explicit only', 'Evaluation for explicit discourse relations only',
+        lambda x: x['Type'] == 'Explicit'),
+    ('Non-explicit only',
+        'Evaluation for non-explicit discourse relations only (Implicit, EntRel, AltLex)',
+        lambda x: x['Type'] != 'Explicit'),
+    ]
+
+PARTIAL_TITLES = {
+    'All': 'Partial Evaluation for all discourse relations',
+    'Explicit only': 'Partial Evaluation for explicit discourse relations',
+    'Non-explicit only':
+        'Partial Evaluation for non-explicit discourse relations only (Implicit, EntRel, AltLex)',
+    }
+
+
+class ScoreResult(object):
+    """The scores of one system output
+
+    exact maps each subset of SUBSETS to the tuple of scorer.evaluate, and
+    partial maps each partial match cutoff to a dictionary from subset to the
+    tuple of partial_scorer.score_partial. sense_level_cms maps each
+    subset to the (level, ConfusionMatrix) list of the exact sense scores at
+    the requested sense levels, and doc_scores is the scorer.DocumentScores
+    of all relations if they were requested.
+    """
+
+    def __init__(self):
+        self.exact = OrderedDict()
+        self.sense_level_cms = OrderedDict()
+        self.partial = OrderedDict()
+        self.doc_scores = None
+
+    def prf(self, subset='All', cutoff=None):
+        """Precision, recall, and F1 of the parser, with exact matching or
+        with partial matching at cutoff"""
+        if cutoff is None:
+            return self.exact[subset][5:8]
+        return self.partial[cutoff][subset][3]
+
+    def measures(self):
+        """The (key, value) measures of evaluation.prototext in report order"""
+        measures = []
+        for subset, result_tuple in self.exact.items():
+            measures.extend(exact_measures(subset, result_tuple))
+        for cutoff, partial_results in self.partial.items():
+            for subset, result_tuple in partial_results.items():
+                measures.extend(partial_match_measures(
+                    partial_match_prefix(subset, cutoff), result_tuple))
+        return measures
+
+
+class Scorer(object):
+    """The gold standard prepared once for scoring many system outputs
+
+    The argument spans of the gold relations are converted here and kept by
+    the scorer; gold_spans are the span.relation_spans of gold_list if they
+    have been converted already. The relation dictionaries are not changed,
+    and changing the gold relations afterwards needs a new Scorer.
+    """
+
+    def __init__(self, gold_list, sense_levels=None, alignment_cache=None, gold_spans=None):
+        from scorer import GoldIndex
+        self.sense_levels = sense_levels
+        self.alignment_cache = alignment_cache
+        self.gold_indexes = OrderedDict()
+        with PROFILER.phase('gold indexing'):
+            if gold_spans is None:
+                gold_spans = relation_spans(gold_list)
+            for subset, _, keep in SUBSETS:
+                kept = [i for i, x in enumerate(gold_list) if keep(x)]
+                self.gold_indexes[subset] = GoldIndex([gold_list[i] for i in kept],
+                    spans=[gold_spans[i] for i in kept])
+
+    def score(self, predicted_list, partial_cutoffs=(), bounded_doc_ids=None,
+            doc_scores=False, predicted_spans=None):
+        """Score a system output
+
+        The argument spans of the system output are converted on every call,
+        unless predicted_spans, its span.relation_spans, are given.
+
+        Input:
+            partial_cutoffs : the cutoffs at which to run the partial scorer
+            bounded_doc_ids : the documents to align greedily in the partial
+                scorer (see alignment_complexity.select_bounded_doc_ids)
+            doc_scores : whether to collect the per-document counts of all
+                relations
+
+        Returns:
+            A ScoreResult
+        """
+        from scorer import DocumentScores, collapse_sense_levels, score_exact
+        from partial_scorer import score_partial
+        result = ScoreResult()
+        if doc_scores:
+            result.doc_scores = DocumentScores()
+        if predicted_spans is None:
+            predicted_spans = relation_spans(predicted_list)
+        predicted_lists = OrderedDict()
+        predicted_span_lists = OrderedDict()
+        for subset, _, keep in SUBSETS:
+            if subset == 'All':
+                predicted_lists[subset] = predicted_list
+                predicted_span_lists[subset] = predicted_spans
+            else:
+                kept = [i for i, x in enumerate(predicted_list) if keep(x)]
+                predicted_lists[subset] = [predicted_list[i] for i in kept]
+                predicted_span_lists[subset] = [predicted_spans[i] for i in kept]
+
+        for subset, gold_index in self.gold_indexes.items():
+            result.exact[subset] = score_exact(gold_index, predicted_lists[subset],
+                result.doc_scores if subset == 'All' else None, predicted_span_lists[subset])
+            if self.sense_levels:
+                result.sense_level_cms[subset] = collapse_sense_levels(
+                    result.exact[subset][4], self.sense_levels)
+        for cutoff in partial_cutoffs:
+            result.partial[cutoff] = OrderedDict()
+            for subset, gold_index in self.gold_indexes.items():
+                result.partial[cutoff][subset] = score_partial(gold_index.gold_list,
+                    predicted_lists[subset], cutoff, bounded_doc_ids, self.alignment_cache,
+                    self.sense_levels, gold_index.valid_senses, gold_index.spans,
+                    predicted_span_lists[subset])
+        return result
+
+def print_score_result(result):
+    """Print the report of tira_eval.py for a ScoreResult"""
+    from scorer import print_evaluation, print_sense_levels
+    from partial_scorer import print_partial_result
+    with PROFILER.phase('report printing'):
+        titles = dict((subset, title) for subset, title, _ in SUBSETS)
+        for subset, result_tuple in result.exact.items():
+            print titles[subset]
+            print_evaluation(*result_tuple[:5])
+            if result.sense_level_cms.get(subset):
+                print_sense_levels(result.sense_level_cms[subset])
+        for cutoff, partial_results in result.partial.items():
+            for subset, result_tuple in partial_results.items():
+                print '\n%s' % PARTIAL_TITLES[subset]
+                print 'PARTIAL EVALUATION - For diagnostics only and not for ranking'
+                print 'Aligning relations - This will time out after 120 seconds'
+                print_partial_result(result_tuple, cutoff)
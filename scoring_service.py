@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Local scoring service with preloaded gold standards
+
+Every run of tira_eval.py starts a new Python process that imports NumPy,
+loads the gold standard, scores once, and exits. This service loads one or
+more gold standards once and keeps them in memory, and scores system outputs
+sent over HTTP on a pool of worker processes:
+
+python scoring_service.py --dataset en-trial=tutorial/conll16st-en-01-12-16-trial --port 8016
+
+    POST /evaluate?dataset=en-trial             body: the content of output.json
+    POST /evaluate?dataset=en-trial&partial=1   also run the partial scorer
+    POST /evaluate?dataset=en-trial&path=/runs/output.json
+                                                score a file readable by the service
+                                                (may be compressed, see loader.py)
+    GET  /datasets                              the loaded gold standards
+    GET  /metrics                               request counts, latency, queue depth
+    GET  /health
+
+/evaluate answers with the same JSON as evaluation.json (see results_writer.py).
+At most --max-pending evaluations are queued or running at a time. Beyond that
+the service answers 503 with a Retry-After header instead of queueing more work.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import deque
+from multiprocessing import Pool, TimeoutError, cpu_count
+
+import validator
+from loader import load_relations, read_file
+from results_writer import ResultsWriter, DEFAULT_PARTIAL_CUTOFF
+from scoring import Scorer
+
+LATENCY_WINDOW = 1000
+
+# Gold standards by dataset name. They are loaded before the worker pool is
+# started, so the workers inherit them instead of loading them again.
+_DATASETS = {}
+
+
+class ServiceError(Exception):
+    """An error to report to the client with an HTTP status"""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def load_dataset(data_dir):
+    """Load relations.json of a dataset and prepare a scoring.Scorer for it"""
+    gold_relations = load_relations('%s/relations.json' % data_dir)
+    return {
+        'data_dir': data_dir,
+        'language': validator.identify_language(gold_relations),
+        'relations': gold_relations,
+        'scorer': Scorer(gold_relations),
+        }
+
+def _init_worker():
+    # Nothing should print in a worker, and nobody would read it.
+    sys.stdout = open(os.devnull, 'w')
+
+def score_run(dataset_name, output_text, output_path, partial):
+    """Score a system output against a preloaded gold standard (in a worker)
+
+    Returns:
+        A tuple of (HTTP status, result dictionary)
+    """
+    dataset = _DATASETS[dataset_name]
+    try:
+        if output_path is not None:
+            output_text = read_file(output_path)
+        predicted_relations = [json.loads(x) for x in output_text.splitlines() if x.strip()]
+    except (IOError, ValueError) as error:
+        return 400, {'error': 'Cannot read the system output: %s' % error}
+    if not validator.validate_relation_list(predicted_relations, dataset['language']):
+        return 400, {'error': 'The system output does not pass the validator'}
+
+    results_writer = ResultsWriter()
+    try:
+        results_writer.add_score_result(dataset['scorer'].score(predicted_relations,
+            partial_cutoffs=[DEFAULT_PARTIAL_CUTOFF] if partial else []))
+    except KeyboardInterrupt:
+        # raised by the alignment time limit (see threading_timer_decorator_exit)
+        return 504, {'error': 'Alignment took too long'}
+    return 200, json.loads(json.dumps(results_writer.to_dict()))
+
+
+class ServiceMetrics(object):
+    """Request counters and latencies, shared by the request threads"""
+
+    def __init__(self, max_pending):
+        self.lock = threading.Lock()
+        self.max_pending = max_pending
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.started = time.time()
+        self.status_counts = {}
+        self.latencies = {}
+
+    def try_acquire(self):
+        """Reserve a place in the queue, or return False if it is full"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+            return True
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+
+    def record(self, endpoint, status, seconds):
+        with self.lock:
+            key = '%s %s' % (endpoint, status)
+            self.status_counts[key] = self.status_counts.get(key, 0) + 1
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = deque(maxlen=LATENCY_WINDOW)
+            self.latencies[endpoint].append(seconds)
+
+    def to_dict(self):
+        with self.lock:
+            latency = {}
+            for endpoint, seconds in self.latencies.items():
+                ordered = sorted(seconds)
+                latency[endpoint] = {
+                    'count': len(ordered),
+                    'mean': sum(ordered) / len(ordered),
+                    'p50': ordered[len(ordered) // 2],
+                    'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    'max': ordered[-1],
+                    }
+            return {
+                'uptime_seconds': time.time() - self.started,
+                'queue_depth': self.pending,
+                'max_queue_depth_seen': self.max_pending_seen,
+                'max_pending': self.max_pending,
+                'responses': dict(self.status_counts),
+                'latency_seconds': latency,
+                }
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        start_time = time.time()
+        url = urlparse.urlparse(self.path)
+        endpoint = url.path
+        try:
+            if method == 'GET' and endpoint == '/health':
+                status, result = 200, {'status': 'ok'}
+            elif method == 'GET' and endpoint == '/datasets':
+                status, result = 200, dict((name, {'data_dir': x['data_dir'],
+                    'language': x['language'], 'relations': len(x['relations'])})
+                    for name, x in _DATASETS.items())
+            elif method == 'GET' and endpoint == '/metrics':
+                status, result = 200, self.server.metrics.to_dict()
+            elif method == 'POST' and endpoint == '/evaluate':
+                status, result = self._evaluate(urlparse.parse_qs(url.query))
+            else:
+                raise ServiceError(404, 'No such endpoint: %s %s' % (method, endpoint))
+        except ServiceError as error:
+            status, result = error.status, {'error': str(error)}
+        self._respond(status, result)
+        if status == 404:
+            # do not keep a latency window for every path a client makes up
+            endpoint = '(unknown)'
+        self.server.metrics.record(endpoint, status, time.time() - start_time)
+
+    def _evaluate(self, query):
+        dataset_name = query.get('dataset', [None])[0]
+        if dataset_name not in _DATASETS:
+            raise ServiceError(400, 'Unknown dataset %s; loaded: %s' %
+                (dataset_name, ', '.join(sorted(_DATASETS))))
+        partial = query.get('partial', ['0'])[0] not in ('0', 'false', '')
+        output_path = query.get('path', [None])[0]
+        length = int(self.headers.get('Content-Length', 0))
+        output_text = self.rfile.read(length) if length > 0 else ''
+        if output_path is None and length == 0:
+            raise ServiceError(400, 'Send output.json as the request body or give its path')
+
+        metrics = self.server.metrics
+        if not metrics.try_acquire():
+            raise ServiceError(503, 'Too many pending evaluations (%s)' % metrics.max_pending)
+        try:
+            async_result = self.server.pool.apply_async(score_run,
+                (dataset_name, output_text, output_path, partial))
+            return async_result.get(self.server.request_timeout)
+        except TimeoutError:
+            raise ServiceError(504, 'Evaluation did not finish in %s seconds' %
+                self.server.request_timeout)
+        except Exception as error:
+            raise ServiceError(500, 'Evaluation failed: %s' % error)
+        finally:
+            metrics.release()
+
+    def _respond(self, status, result):
+        body = json.dumps(result, indent=1)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ScoringServer(ThreadingMixIn, HTTPServer):
+    """HTTP server that answers each request in its own thread and scores
+    on a shared pool of worker processes"""
+    daemon_threads = True
+
+    def __init__(self, address, pool, max_pending, request_timeout=None, verbose=False):
+        HTTPServer.__init__(self, address, ScoringRequestHandler)
+        self.pool = pool
+        self.metrics = ServiceMetrics(max_pending)
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Keep gold standards in memory and score system outputs over HTTP')
+    parser.add_argument('--dataset', action='append', required=True, metavar='NAME=DATA_DIR',
+        help='Gold standard to load (a folder with relations.json); can be repeated')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8016)
+    parser.add_argument('--workers', type=int, default=cpu_count(),
+        help='Number of scoring processes (default: number of CPUs)')
+    parser.add_argument('--max-pending', type=int,
+        help='Evaluations queued or running before new ones are refused '
+            '(default: twice the number of workers)')
+    parser.add_argument('--timeout', type=float, default=600,
+        help='Seconds to wait for an evaluation before giving up')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    for spec in args.dataset:
+        if '=' not in spec:
+            parser.error('--dataset must be NAME=DATA_DIR, got %s' % spec)
+        name, data_dir = spec.split('=', 1)
+        _DATASETS[name] = load_dataset(data_dir)
+        print 'Loaded %s: %s relations from %s' % (name, len(_DATASETS[name]['relations']), data_dir)
+
+    pool = Pool(args.workers, _init_worker)
+    max_pending = args.max_pending or 2 * args.workers
+    server = ScoringServer((args.host, args.port), pool, max_pending,
+        args.timeout, args.verbose)
+    print 'Serving on http://%s:%s with %s workers' % (args.host, args.port, args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.terminate()
+        pool.join()
+
+if __name__ == '__main__':
+    main()
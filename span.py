@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Run-length token spans
+
+An argument is almost always one or two contiguous ranges of tokens, so a
+span is stored as runs of consecutive token indices, e.g. [3, 4, 5, 9, 10]
+as ((3, 6), (9, 11)), with each run going from start up to but not
+including end. Comparing, hashing, and intersecting spans then takes time in
+the number of runs instead of the number of tokens.
+
+Two spans are equal when their token lists are equal, as exact matching
+requires. The runs are kept in the order of the token list, which is sorted
+for any sensible system output; an unsorted token list or one with repeated
+tokens still gives runs that tell it apart from the sorted list. Length,
+overlap, and intersection treat a span as a set of tokens, as the partial
+matching does.
+
+Spans are never stored in the relation dictionaries, which belong to the
+caller and may be written out or changed between two scorings. Code that
+compares the same arguments many times converts them once with
+relation_spans and keeps the list next to the relation list.
+"""
+
+class Span(object):
+    """Token indices as (start, end) runs
+
+    runs are in the order of the token list and set_runs are sorted and
+    merged so that no two of them overlap or touch. first and last are the
+    first and the last token index of the token list, and size is the number
+    of distinct tokens.
+    """
+
+    __slots__ = ['runs', 'set_runs', 'first', 'last', 'size']
+
+    def __init__(self, runs):
+        self.runs = tuple(runs)
+        if all(self.runs[i][1] < self.runs[i + 1][0] for i in xrange(len(self.runs) - 1)):
+            self.set_runs = self.runs
+        else:
+            merged = []
+            for start, end in sorted(self.runs):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+                else:
+                    merged.append((start, end))
+            self.set_runs = tuple(merged)
+        self.first = self.runs[0][0] if self.runs else None
+        self.last = self.runs[-1][1] - 1 if self.runs else None
+        self.size = sum(end - start for start, end in self.set_runs)
+
+    @classmethod
+    def from_indices(cls, indices):
+        """Span of a list of token indices"""
+        runs = []
+        start = end = None
+        for index in indices:
+            if index == end:
+                end += 1
+            else:
+                if start is not None:
+                    runs.append((start, end))
+                start = index
+                end = index + 1
+        if start is not None:
+            runs.append((start, end))
+        return cls(runs)
+
+    @classmethod
+    def from_token_list(cls, token_list):
+        """Span of a TokenList, either gold token addresses
+        [char start, char end, token index, sentence, token in sentence]
+        or predicted token indices"""
+        if len(token_list) > 0 and isinstance(token_list[0], list):
+            return cls.from_indices([x[2] for x in token_list])
+        return cls.from_indices(token_list)
+
+    def to_list(self):
+        """The token indices in the order of the token list"""
+        return [i for start, end in self.runs for i in xrange(start, end)]
+
+    def __iter__(self):
+        """The distinct token indices in ascending order"""
+        for start, end in self.set_runs:
+            for i in xrange(start, end):
+                yield i
+
+    def __len__(self):
+        return self.size
+
+    def __eq__(self, other):
+        return isinstance(other, Span) and self.runs == other.runs
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.runs)
+
+    def __repr__(self):
+        return 'Span(%r)' % (self.runs,)
+
+    def intersection_size(self, other):
+        """The number of tokens in both spans"""
+        runs = self.set_runs
+        other_runs = other.set_runs
+        i = j = 0
+        size = 0
+        while i < len(runs) and j < len(other_runs):
+            start = max(runs[i][0], other_runs[j][0])
+            end = min(runs[i][1], other_runs[j][1])
+            if start < end:
+                size += end - start
+            if runs[i][1] < other_runs[j][1]:
+                i += 1
+            else:
+                j += 1
+        return size
+
+    def overlaps(self, other):
+        """True if the spans share a token"""
+        return self.intersection_size(other) > 0
+
+
+def token_span(arg):
+    """The Span of the TokenList of an argument or connective dictionary"""
+    return Span.from_token_list(arg['TokenList'])
+
+def relation_spans(relation_list):
+    """The (Arg1 span, Arg2 span) of every relation, in list order"""
+    return [(token_span(x['Arg1']), token_span(x['Arg2'])) for x in relation_list]
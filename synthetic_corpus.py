@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Synthetic gold standard and system output generator
+
+The tutorial data is too small to tell how the scorers scale. This generates
+a gold standard (relations.json) and a system output (output.json) of any size
+in the same format as the real data. The shape of the corpus is controlled by
+
+    num_docs           : the number of documents
+    relations_per_doc  : the number of relations in each document
+    span_length        : the average number of tokens in an argument
+    overlap_density    : how much neighboring relations share tokens (0 to 1)
+    pathological_docs  : the fraction of documents in which every relation
+                         overlaps with every other relation
+
+python synthetic_corpus.py --num-docs 100 --relations-per-doc 30 output_dir
+"""
+import argparse
+import json
+import random
+
+import validator
+from conn_head_mapper import ConnHeadMapper
+
+SENTENCE_LENGTH = 25
+TOKEN_WIDTH = 5
+
+# senses of the relations that are not EntRel
+NON_ENTREL_SENSES = [x for x in validator.EN_SENSES if x != 'EntRel']
+
+_CONNECTIVES = None
+
+def connectives():
+    """Raw connectives that the head mapper knows"""
+    global _CONNECTIVES
+    if _CONNECTIVES is None:
+        _CONNECTIVES = sorted(ConnHeadMapper.DEFAULT_MAPPING)
+    return _CONNECTIVES
+
+def token_address(token_index):
+    """Gold standard token address: [char start, char end, token index,
+    sentence index, token index within the sentence]"""
+    char_start = token_index * TOKEN_WIDTH
+    return [char_start, char_start + TOKEN_WIDTH - 1, token_index,
+            token_index // SENTENCE_LENGTH, token_index % SENTENCE_LENGTH]
+
+def make_span(start, end, raw_text=None):
+    token_list = [token_address(i) for i in range(start, end)]
+    if raw_text is None:
+        raw_text = ' '.join('w%s' % i for i in range(start, end))
+    character_span_list = [[token_list[0][0], token_list[-1][1]]] if token_list else []
+    return {'CharacterSpanList': character_span_list,
+            'RawText': raw_text,
+            'TokenList': token_list}
+
+def generate_gold_doc(rng, doc_id, first_id, relations_per_doc, span_length,
+        overlap_density, pathological):
+    relations = []
+    position = 0
+    for i in range(relations_per_doc):
+        arg1_length = max(1, int(rng.gauss(span_length, span_length / 4.0)))
+        arg2_length = max(1, int(rng.gauss(span_length, span_length / 4.0)))
+        relation = {'DocID': doc_id, 'ID': first_id + i}
+        if rng.random() < 0.4:
+            raw_connective = rng.choice(connectives())
+            connective_length = len(raw_connective.split())
+            relation['Type'] = 'Explicit'
+        else:
+            raw_connective = ''
+            connective_length = 0
+            relation['Type'] = rng.choice(['Implicit', 'Implicit', 'EntRel', 'AltLex'])
+        arg1_end = position + arg1_length
+        arg2_start = arg1_end + connective_length
+        relation['Arg1'] = make_span(position, arg1_end)
+        relation['Connective'] = make_span(arg1_end, arg2_start, raw_connective)
+        relation['Arg2'] = make_span(arg2_start, arg2_start + arg2_length)
+        if relation['Type'] == 'EntRel':
+            relation['Sense'] = ['EntRel']
+        else:
+            relation['Sense'] = [rng.choice(NON_ENTREL_SENSES)]
+        relations.append(relation)
+
+        relation_length = arg2_start + arg2_length - position
+        if pathological:
+            position += rng.randint(0, 1)
+        else:
+            position += max(1, int(relation_length * (1.0 - overlap_density)))
+    return relations
+
+def perturb_span(rng, token_indices, boundary_noise):
+    """Move the span boundaries by a few tokens"""
+    if len(token_indices) == 0 or rng.random() >= boundary_noise:
+        return list(token_indices)
+    start = token_indices[0] + rng.randint(-2, 2)
+    end = token_indices[-1] + 1 + rng.randint(-2, 2)
+    start = max(0, start)
+    if end <= start:
+        end = start + 1
+    return list(range(start, end))
+
+def generate_predicted_doc(rng, gold_relations, boundary_noise, miss_rate,
+        spurious_rate, sense_error_rate):
+    predicted = []
+    for g_relation in gold_relations:
+        if rng.random() < miss_rate:
+            continue
+        p_relation = {'DocID': g_relation['DocID'], 'Type': g_relation['Type']}
+        for key in ['Arg1', 'Arg2']:
+            token_indices = [x[2] for x in g_relation[key]['TokenList']]
+            p_relation[key] = {'TokenList': perturb_span(rng, token_indices, boundary_noise)}
+        p_relation['Connective'] = {
+            'TokenList': [x[2] for x in g_relation['Connective']['TokenList']]}
+        if rng.random() < sense_error_rate:
+            p_relation['Sense'] = [rng.choice(validator.EN_SENSES)]
+        else:
+            p_relation['Sense'] = list(g_relation['Sense'])
+        predicted.append(p_relation)
+        if rng.random() < spurious_rate:
+            spurious = json.loads(json.dumps(p_relation))
+            for key in ['Arg1', 'Arg2']:
+                spurious[key]['TokenList'] = perturb_span(rng, spurious[key]['TokenList'], 1.0)
+            predicted.append(spurious)
+    return predicted
+
+def generate_corpus(num_docs=10, relations_per_doc=20, span_length=15,
+        overlap_density=0.2, pathological_docs=0.0, boundary_noise=0.3,
+        miss_rate=0.1, spurious_rate=0.1, sense_error_rate=0.3, seed=0):
+    """Generate a gold standard and a system output
+
+    Returns:
+        A tuple of (gold relation list, predicted relation list)
+    """
+    rng = random.Random(seed)
+    gold_list = []
+    predicted_list = []
+    for d in range(num_docs):
+        doc_id = 'syn_%05d' % d
+        pathological = rng.random() < pathological_docs
+        gold_relations = generate_gold_doc(rng, doc_id, len(gold_list),
+            relations_per_doc, span_length, overlap_density, pathological)
+        gold_list.extend(gold_relations)
+        predicted_list.extend(generate_predicted_doc(rng, gold_relations,
+            boundary_noise, miss_rate, spurious_rate, sense_error_rate))
+    return gold_list, predicted_list
+
+def write_relations(relation_list, file_name):
+    f = open(file_name, 'w')
+    for relation in relation_list:
+        f.write(json.dumps(relation) + '\n')
+    f.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic gold standard and system output')
+    parser.add_argument('output_dir',
+        help='Folder to write relations.json and output.json to')
+    parser.add_argument('--num-docs', default=10, type=int)
+    parser.add_argument('--relations-per-doc', default=20, type=int)
+    parser.add_argument('--span-length', default=15, type=int)
+    parser.add_argument('--overlap-density', default=0.2, type=float)
+    parser.add_argument('--pathological-docs', default=0.0, type=float,
+        help='Fraction of documents where all spans overlap')
+    parser.add_argument('--boundary-noise', default=0.3, type=float)
+    parser.add_argument('--miss-rate', default=0.1, type=float)
+    parser.add_argument('--spurious-rate', default=0.1, type=float)
+    parser.add_argument('--sense-error-rate', default=0.3, type=float)
+    parser.add_argument('--seed', default=0, type=int)
+    args = parser.parse_args()
+    gold_list, predicted_list = generate_corpus(args.num_docs,
+        args.relations_per_doc, args.span_length, args.overlap_density,
+        args.pathological_docs, args.boundary_noise, args.miss_rate,
+        args.spurious_rate, args.sense_error_rate, args.seed)
+    write_relations(gold_list, '%s/relations.json' % args.output_dir)
+    write_relations(predicted_list, '%s/output.json' % args.output_dir)
+
+if __name__ == '__main__':
+    main()
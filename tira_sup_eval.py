@@ -4,61 +4,253 @@
 (Supplementary task of discourse relation sense classification only)
 
 """
-import json
 import sys
-from scorer import evaluate
-from partial_scorer import partial_evaluate
-from validator import validate_relation_list, identify_language
+from ingest import IngestError, ingest_gold_and_predicted
+from loader import find_input
+from span import token_span
+from scorer import build_sense_alphabet, connective_head_matching, print_evaluation
+from validator import identify_valid_senses
 from tira_eval import write_proto_text, write_results
+from results_writer import ResultsWriter
 
-def use_gold_standard_types(sorted_gold_relations, sorted_predicted_relations):
-    for gr, pr in zip(sorted_gold_relations, sorted_predicted_relations):
-        if gr['ID'] != pr['ID']:
-            print >> sys.stderr, 'ID mismatch. Make sure you copy the ID from gold standard'
-            exit(1)
+def _numpy():
+    """NumPy, imported on first use"""
+    import numpy
+    return numpy
+
+def _confusion_matrix():
+    """The confusion_matrix module, imported on first use as it loads NumPy"""
+    import confusion_matrix
+    return confusion_matrix
+
+SUBSETS = [
+    ('All', 'Evaluation for all discourse relations',
+        lambda x: True),
+    ('Explicit only', 'Evaluation for explicit discourse relations only',
+        lambda x: x['Type'] == 'Explicit'),
+    ('Non-explicit only',
+        'Evaluation for non-explicit discourse relations only (Implicit, EntRel, AltLex)',
+        lambda x: x['Type'] != 'Explicit'),
+    ]
+
+MAX_REPORTED_IDS = 20
+
+def join_by_id(gold_relations, predicted_relations, predicted_by_id=None,
+        duplicate_predicted_ids=None):
+    """Pair every gold relation with the predicted relation of the same ID
+
+    The predicted relations are indexed by ID here unless the index is
+    given, as ingest.ingest_relations builds it.
+
+    Returns:
+        A tuple of (list of predicted relations in the order of
+        gold_relations, dictionary of problems). The problems are lists of
+        IDs under 'missing' (gold IDs without a prediction), 'unexpected'
+        (predicted IDs not in the gold standard), 'duplicate predicted' and
+        'duplicate gold'. The list of predicted relations is only complete
+        when there are no problems.
+    """
+    if predicted_by_id is None:
+        predicted_by_id = {}
+        duplicate_predicted_ids = []
+        for relation in predicted_relations:
+            if relation['ID'] in predicted_by_id:
+                duplicate_predicted_ids.append(relation['ID'])
+            else:
+                predicted_by_id[relation['ID']] = relation
+    gold_ids = set()
+    duplicate_gold_ids = []
+    joined_predicted_relations = []
+    missing_ids = []
+    for relation in gold_relations:
+        if relation['ID'] in gold_ids:
+            duplicate_gold_ids.append(relation['ID'])
+        gold_ids.add(relation['ID'])
+        if relation['ID'] in predicted_by_id:
+            joined_predicted_relations.append(predicted_by_id[relation['ID']])
+        else:
+            missing_ids.append(relation['ID'])
+    problems = {
+        'missing': missing_ids,
+        'unexpected': [x for x in predicted_by_id if x not in gold_ids],
+        'duplicate predicted': duplicate_predicted_ids,
+        'duplicate gold': duplicate_gold_ids,
+        }
+    return joined_predicted_relations, problems
+
+def report_id_problems(problems):
+    """Print the ID problems to stderr
+
+    Returns:
+        True if there was any problem
+    """
+    found_problem = False
+    for name in ['missing', 'unexpected', 'duplicate predicted', 'duplicate gold']:
+        ids = sorted(problems[name])
+        if len(ids) == 0:
+            continue
+        found_problem = True
+        shown = ' '.join(str(x) for x in ids[:MAX_REPORTED_IDS])
+        if len(ids) > MAX_REPORTED_IDS:
+            shown += ' ...'
+        print >> sys.stderr, '%s %s IDs: %s' % (len(ids), name, shown)
+    if found_problem:
+        print >> sys.stderr, 'ID mismatch. Make sure you copy the ID from gold standard'
+    return found_problem
+
+def use_gold_standard_types(gold_relations, joined_predicted_relations):
+    for gr, pr in zip(gold_relations, joined_predicted_relations):
         pr['Type'] = gr['Type']
-         
+
+def _binary_cm(matches, num_gold, num_predicted):
+    """The yes/no ConfusionMatrix of scorer.compute_binary_eval_metric
+    from a boolean array of matched pairs"""
+    confusion_matrix = _confusion_matrix()
+    binary_alphabet = confusion_matrix.Alphabet()
+    binary_alphabet.add('yes')
+    binary_alphabet.add('no')
+    cm = confusion_matrix.ConfusionMatrix(binary_alphabet)
+    num_correct = matches.sum()
+    cm.matrix[0, 0] = num_correct
+    cm.matrix[1, 0] = num_gold - num_correct
+    cm.matrix[0, 1] = num_predicted - num_correct
+    return cm
+
+def sense_only_evaluate(gold_relations, joined_predicted_relations, valid_senses):
+    """Score the relations of the supplementary task
+
+    The i-th predicted relation is the prediction for the i-th gold relation.
+    A pair counts as an argument match when both arguments have the same
+    tokens, so that a system output with altered arguments is scored like
+    scorer.evaluate scores it, but without comparing every gold relation
+    to every predicted relation. The sense confusion matrices of all subsets
+    are filled from one array of (predicted sense, gold sense) indices.
+
+    Returns:
+        A dictionary mapping each subset name of SUBSETS to a result tuple
+        like the one of scorer.evaluate
+    """
+    numpy = _numpy()
+    confusion_matrix = _confusion_matrix()
+    negative = confusion_matrix.ConfusionMatrix.NEGATIVE_CLASS
+    num_pairs = len(gold_relations)
+    is_explicit = numpy.array([x['Type'] == 'Explicit' for x in gold_relations], dtype=bool)
+    same_doc = numpy.array([g['DocID'] == p['DocID']
+        for g, p in zip(gold_relations, joined_predicted_relations)], dtype=bool)
+    arg1_matches = same_doc & numpy.array([token_span(g['Arg1']) == token_span(p['Arg1'])
+        for g, p in zip(gold_relations, joined_predicted_relations)], dtype=bool)
+    arg2_matches = same_doc & numpy.array([token_span(g['Arg2']) == token_span(p['Arg2'])
+        for g, p in zip(gold_relations, joined_predicted_relations)], dtype=bool)
+    rel_arg_matches = arg1_matches & arg2_matches
+    connective_matches = numpy.array([is_explicit[i] and connective_head_matching(
+            (g['DocID'], g['Connective']['TokenList'], g['Connective']['RawText']),
+            (p['DocID'], p['Connective']['TokenList']))
+        for i, (g, p) in enumerate(zip(gold_relations, joined_predicted_relations))], dtype=bool)
+
+    # The sense outcomes of the pairs as (pair, predicted sense, gold sense),
+    # following scorer.evaluate_sense. A linked pair gives one outcome; a pair
+    # whose arguments do not match gives a missed gold relation and a
+    # spurious predicted relation.
+    outcome_pairs = []
+    predicted_senses = []
+    gold_senses = []
+    for i, (g, p) in enumerate(zip(gold_relations, joined_predicted_relations)):
+        gold_sense = g['Sense'][0]
+        predicted_sense = p['Sense'][0]
+        if rel_arg_matches[i]:
+            if gold_sense in valid_senses:
+                if predicted_sense in g['Sense']:
+                    gold_sense = predicted_sense
+                outcome_pairs.append(i)
+                predicted_senses.append(predicted_sense)
+                gold_senses.append(gold_sense)
+        else:
+            if gold_sense in valid_senses:
+                outcome_pairs.append(i)
+                predicted_senses.append(negative)
+                gold_senses.append(gold_sense)
+            outcome_pairs.append(i)
+            predicted_senses.append(predicted_sense)
+            gold_senses.append(negative)
+    outcome_pairs = numpy.array(outcome_pairs, dtype=numpy.int64)
+    labels = sorted(set(predicted_senses) | set(gold_senses))
+    label_ids = dict((x, i) for i, x in enumerate(labels))
+    predicted_ids = numpy.array([label_ids[x] for x in predicted_senses], dtype=numpy.int64)
+    gold_ids = numpy.array([label_ids[x] for x in gold_senses], dtype=numpy.int64)
+
+    results = {}
+    for subset, _, keep in SUBSETS:
+        in_subset = numpy.array([keep(x) for x in gold_relations], dtype=bool)
+        sense_alphabet = build_sense_alphabet(
+            [x for x in gold_relations if keep(x)], valid_senses)
+        negative_index = sense_alphabet.get_index(negative)
+        # A predicted sense that is not a sense of the gold standard counts
+        # as the negative class, unless it is one of the senses of its gold
+        # relation, which scorer.evaluate_sense adds to the alphabet.
+        added_senses = set(x for i, x, y in zip(outcome_pairs, predicted_senses, gold_senses)
+            if in_subset[i] and x == y and not sense_alphabet.has_label(x))
+        for sense in sorted(added_senses):
+            sense_alphabet.add(sense)
+        label_map = numpy.array([sense_alphabet.get_index(x)
+            if sense_alphabet.has_label(x) else negative_index for x in labels],
+            dtype=numpy.int64)
+        sense_cm = confusion_matrix.ConfusionMatrix(sense_alphabet)
+        if len(outcome_pairs) > 0:
+            selected = in_subset[outcome_pairs]
+            numpy.add.at(sense_cm.matrix,
+                (label_map[predicted_ids[selected]], label_map[gold_ids[selected]]), 1)
+
+        num_subset = in_subset.sum()
+        num_connectives = (in_subset & is_explicit).sum()
+        connective_cm = _binary_cm(connective_matches & in_subset,
+            num_connectives, num_connectives)
+        arg1_cm = _binary_cm(arg1_matches & in_subset, num_subset, num_subset)
+        arg2_cm = _binary_cm(arg2_matches & in_subset, num_subset, num_subset)
+        rel_arg_cm = _binary_cm(rel_arg_matches & in_subset, num_subset, num_subset)
+        precision, recall, f1 = sense_cm.compute_micro_average_f1()
+        results[subset] = (connective_cm, arg1_cm, arg2_cm, rel_arg_cm, sense_cm,
+            precision, recall, f1)
+    return results
 
 def main(args):
     input_dataset = args[1]
     input_run = args[2]
     output_dir = args[3]
 
-    gold_relations = [json.loads(x) for x in open('%s/relations.json' % input_dataset)]
-    predicted_relations = [json.loads(x) for x in open('%s/output.json' % input_run)]
-    if len(gold_relations) != len(predicted_relations):
-        err_message = 'Gold standard has % instances; predicted %s instances' % \
-                (len(gold_relations), len(predicted_relations))
-        print >> sys.stderr, err_message
+    try:
+        gold, predicted = ingest_gold_and_predicted(
+            find_input('%s/relations.json' % input_dataset),
+            find_input('%s/output.json' % input_run), index_predicted_ids=True)
+    except IngestError as error:
+        print >> sys.stderr, error
+        print >> sys.stderr, 'Invalid format'
         exit(1)
-
-    language = identify_language(gold_relations)
-    all_correct = validate_relation_list(predicted_relations, language)
-    if not all_correct:
+    if predicted.report_soft_errors():
         print >> sys.stderr, 'Invalid format'
         exit(1)
 
-    gold_relations = sorted(gold_relations, key=lambda x: x['ID'])
-    predicted_relations = sorted(predicted_relations, key=lambda x: x['ID'])
+    gold_relations = sorted(gold.relations, key=lambda x: x['ID'])
+    predicted_relations, problems = join_by_id(gold_relations, predicted.relations,
+        predicted.by_id, predicted.duplicate_ids)
+    if report_id_problems(problems):
+        exit(1)
     use_gold_standard_types(gold_relations, predicted_relations)
+    results = sense_only_evaluate(gold_relations, predicted_relations,
+        identify_valid_senses(gold_relations))
 
     output_file = open('%s/evaluation.prototext' % output_dir, 'w')
-    print 'Evaluation for all discourse relations'
-    write_results('All', evaluate(gold_relations, predicted_relations), output_file)
-
-    print 'Evaluation for explicit discourse relations only'
-    explicit_gold_relations = [x for x in gold_relations if x['Type'] == 'Explicit']
-    explicit_predicted_relations = [x for x in predicted_relations if x['Type'] == 'Explicit']
-    write_results('Explicit only', \
-        evaluate(explicit_gold_relations, explicit_predicted_relations), output_file)
+    results_writer = ResultsWriter()
+    def record_exact(prefix, result_tuple):
+        write_results(prefix, result_tuple, output_file)
+        results_writer.add_exact(prefix, result_tuple)
 
-    print 'Evaluation for non-explicit discourse relations only (Implicit, EntRel, AltLex)'
-    non_explicit_gold_relations = [x for x in gold_relations if x['Type'] != 'Explicit']
-    non_explicit_predicted_relations = [x for x in predicted_relations if x['Type'] != 'Explicit']
-    write_results('Non-explicit only', \
-        evaluate(non_explicit_gold_relations, non_explicit_predicted_relations), output_file)
+    for subset, title, _ in SUBSETS:
+        print title
+        print_evaluation(*results[subset][:5])
+        record_exact(subset, results[subset])
 
     output_file.close()
+    results_writer.write_json('%s/evaluation.json' % output_dir)
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -10,6 +10,8 @@ import argparse
 import json
 import sys
 
+from loader import read_lines
+
 RELATION_TYPES = ['Explicit', 'Implicit', 'AltLex', 'EntRel', 'NoRel']
 EN_SENSES = [
     'Temporal.Asynchronous.Precedence',
@@ -43,7 +45,7 @@ ZH_SENSES = [
     ]
 
 def validate_file(file_name, language):
-    lines = open(file_name)
+    lines = read_lines(file_name)
     all_correct = True
     for i, line in enumerate(lines):
         try:
@@ -71,6 +73,20 @@ def validate_relation_list(relation_list, language):
             all_correct = False
     return all_correct
  
+def check_structure(relation):
+    """Check the fields that the scorers cannot do without
+
+    The other checks find relations that can still be scored, only not as
+    correct.
+    """
+    for field in ['DocID', 'Type', 'Sense']:
+        if field not in relation:
+            raise ValueError('Field \'%s\' is required but not found' % field)
+    if not isinstance(relation['Sense'], list) or len(relation['Sense']) == 0:
+        raise TypeError('Sense field must be a list of one element')
+    check_args(relation)
+    check_connective(relation)
+
 def check_type(relation):
     if 'Type' not in relation:
         raise ValueError('Field \'Type\' is required but not found')
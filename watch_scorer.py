@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Rescore the system output whenever it changes
+
+During development output.json is rewritten over and over, often with only a
+few documents changed. This script keeps the match outcomes of every
+document in memory. When the file changes, it hashes the relations of each
+document, decodes and rescores only the documents whose hash changed, and
+updates the corpus totals by taking out the old outcomes of those documents
+and adding in the new ones.
+
+python watch_scorer.py --partial tutorial/conll16st-en-01-12-16-trial/relations.json tutorial/output.json
+
+Relations only match relations of the same document, so the totals are the
+same as those of scorer.py (and partial_scorer.py with --partial).
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+
+import aligner
+import partial_scorer
+import scorer
+import validator
+from confusion_matrix import ConfusionMatrix
+from doc_index import build_relation_offsets
+from loader import load_relations
+from scoring import SUBSETS
+
+EXACT_OUTCOMES = ['connective', 'arg1', 'arg2', 'arg12', 'sense']
+
+def read_document_lines(relation_file):
+    """Group the lines of a JSON-lines relation file by DocID without
+    decoding them
+
+    Returns:
+        A dictionary mapping DocID to a tuple of (content hash, lines)
+    """
+    buf = open(relation_file, 'rb').read()
+    documents = {}
+    for doc_id, ranges in build_relation_offsets(buf).items():
+        lines = [buf[offset:offset + length] for offset, length in ranges]
+        documents[doc_id] = (hashlib.sha1('\n'.join(lines)).hexdigest(), lines)
+    return documents
+
+
+class IncrementalScorer(object):
+    """Per-document outcomes and corpus totals that are updated document by
+    document as the system output changes"""
+
+    def __init__(self, gold_list, partial_match_cutoff=None):
+        self.partial_match_cutoff = partial_match_cutoff
+        self.valid_senses = validator.identify_valid_senses(gold_list)
+        self.gold_by_doc_id = defaultdict(list)
+        for relation in gold_list:
+            self.gold_by_doc_id[relation['DocID']].append(relation)
+        # The sense confusion matrices of all documents share one alphabet
+        # so that they can be added up.
+        self.sense_alphabets = {}
+        for subset, _, keep in SUBSETS:
+            self.sense_alphabets[subset] = scorer.build_sense_alphabet(
+                [x for x in gold_list if keep(x)], self.valid_senses)
+        self.doc_hashes = {}
+        self.doc_outcomes = {}
+        self.totals = {}
+        for subset, _, _ in SUBSETS:
+            self.totals[subset] = {'exact': None, 'partial': None}
+
+    def update(self, predicted_documents):
+        """Rescore the documents whose relations changed
+
+        Input:
+            predicted_documents : the output of read_document_lines
+
+        Returns:
+            The list of DocIDs that were rescored
+        """
+        all_doc_ids = set(self.gold_by_doc_id) | set(predicted_documents) | \
+            set(self.doc_hashes)
+        changed_doc_ids = []
+        for doc_id in sorted(all_doc_ids):
+            doc_hash, lines = predicted_documents.get(doc_id, (None, []))
+            if doc_id in self.doc_hashes and self.doc_hashes[doc_id] == doc_hash:
+                continue
+            predicted_list = [json.loads(x) for x in lines]
+            self._replace_outcomes(doc_id, self._score_document(doc_id, predicted_list))
+            self.doc_hashes[doc_id] = doc_hash
+            changed_doc_ids.append(doc_id)
+        return changed_doc_ids
+
+    def _score_document(self, doc_id, predicted_list):
+        gold_list = self.gold_by_doc_id.get(doc_id, [])
+        outcomes = {}
+        for subset, _, keep in SUBSETS:
+            subset_gold = [x for x in gold_list if keep(x)]
+            subset_predicted = [x for x in predicted_list if keep(x)]
+            connective_cm = scorer.evaluate_connectives(subset_gold, subset_predicted)
+            arg1_cm, arg2_cm, rel_arg_cm = scorer.evaluate_argument_extractor(
+                subset_gold, subset_predicted)
+            sense_cm = scorer.evaluate_sense(subset_gold, subset_predicted,
+                sense_alphabet=self.sense_alphabets[subset], valid_senses=self.valid_senses)
+            outcomes[subset] = {
+                'exact': dict(zip(EXACT_OUTCOMES,
+                    [connective_cm, arg1_cm, arg2_cm, rel_arg_cm, sense_cm])),
+                'partial': None,
+                }
+            if self.partial_match_cutoff is not None:
+                outcomes[subset]['partial'] = self._score_partial(subset_gold, subset_predicted)
+        return outcomes
+
+    def _score_partial(self, gold_list, predicted_list):
+        cutoff = self.partial_match_cutoff
+        arg1_alignment, arg2_alignment, relation_alignment = \
+            aligner.align_relation_arrays(gold_list, predicted_list, cutoff)
+        counts = {
+            'arg1': partial_scorer.evaluate_arg_partial_match(arg1_alignment, 1, cutoff),
+            'arg2': partial_scorer.evaluate_arg_partial_match(arg2_alignment, 2, cutoff),
+            'arg12': partial_scorer.count_rel_arg_whole_rel(relation_alignment, cutoff),
+            'arg1 tokens': partial_scorer.evaluate_arg_tokenwise(arg1_alignment, 1),
+            'arg2 tokens': partial_scorer.evaluate_arg_tokenwise(arg2_alignment, 2),
+            }
+        sense_cm = partial_scorer.evaluate_sense(relation_alignment, self.valid_senses)
+        return {'counts': counts, 'sense_cm': sense_cm}
+
+    def _replace_outcomes(self, doc_id, new_outcomes):
+        old_outcomes = self.doc_outcomes.get(doc_id)
+        for subset, _, _ in SUBSETS:
+            totals = self.totals[subset]
+            if totals['exact'] is None:
+                totals['exact'] = dict((k, _copy_cm(v))
+                    for k, v in new_outcomes[subset]['exact'].items())
+            else:
+                for k, cm in new_outcomes[subset]['exact'].items():
+                    totals['exact'][k].matrix += cm.matrix
+                    if old_outcomes is not None:
+                        totals['exact'][k].matrix -= old_outcomes[subset]['exact'][k].matrix
+            new_partial = new_outcomes[subset]['partial']
+            if new_partial is None:
+                continue
+            if totals['partial'] is None:
+                totals['partial'] = {
+                    'counts': dict((k, list(v)) for k, v in new_partial['counts'].items()),
+                    'sense_cm': _copy_cm(new_partial['sense_cm']),
+                    }
+            else:
+                old_partial = old_outcomes[subset]['partial'] if old_outcomes is not None else None
+                for k, counts in new_partial['counts'].items():
+                    for i in xrange(3):
+                        totals['partial']['counts'][k][i] += counts[i]
+                        if old_partial is not None:
+                            totals['partial']['counts'][k][i] -= old_partial['counts'][k][i]
+                totals['partial']['sense_cm'].matrix += new_partial['sense_cm'].matrix
+                if old_partial is not None:
+                    totals['partial']['sense_cm'].matrix -= old_partial['sense_cm'].matrix
+        self.doc_outcomes[doc_id] = new_outcomes
+
+    def print_totals(self):
+        for subset, title, _ in SUBSETS:
+            totals = self.totals[subset]
+            if totals['exact'] is None:
+                continue
+            print '\n================================================'
+            print title
+            scorer.print_evaluation(*[totals['exact'][k] for k in EXACT_OUTCOMES])
+            if totals['partial'] is not None:
+                counts = totals['partial']['counts']
+                arg1_prf, arg2_prf, total_prf = partial_scorer.compute_arg_prfs(
+                    counts['arg1'], counts['arg2'])
+                print '\nPARTIAL EVALUATION - For diagnostics only and not for ranking'
+                partial_scorer.print_partial_evaluation(arg1_prf, arg2_prf, total_prf,
+                    partial_scorer.compute_prf(*counts['arg12']),
+                    totals['partial']['sense_cm'], self.partial_match_cutoff)
+                partial_scorer.print_tokenwise_evaluation(*partial_scorer.compute_arg_prfs(
+                    counts['arg1 tokens'], counts['arg2 tokens']))
+
+def _copy_cm(cm):
+    copy = ConfusionMatrix(cm.alphabet)
+    copy.matrix = cm.matrix.copy()
+    return copy
+
+def _file_signature(file_name):
+    stat = os.stat(file_name)
+    return stat.st_size, stat.st_mtime
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rescore the changed documents whenever the system output changes')
+    parser.add_argument('gold', help='Gold standard file')
+    parser.add_argument('predicted', help='System output file to watch')
+    parser.add_argument('--partial', action='store_true',
+        help='Also keep the partial matching scores up to date')
+    parser.add_argument('--cutoff', help='Cutoff value for partial matching', default=0.7, type=float)
+    parser.add_argument('--interval', type=float, default=1.0,
+        help='Seconds between checks of the system output')
+    args = parser.parse_args()
+
+    incremental_scorer = IncrementalScorer(load_relations(args.gold),
+        args.cutoff if args.partial else None)
+    signature = None
+    try:
+        while True:
+            try:
+                new_signature = _file_signature(args.predicted)
+            except OSError:
+                new_signature = None
+            if new_signature is not None and new_signature != signature:
+                start_time = time.time()
+                try:
+                    predicted_documents = read_document_lines(args.predicted)
+                    changed_doc_ids = incremental_scorer.update(predicted_documents)
+                except ValueError as error:
+                    # most likely caught the file in the middle of being written
+                    print 'Cannot read %s yet: %s' % (args.predicted, error)
+                else:
+                    signature = new_signature
+                    incremental_scorer.print_totals()
+                    print '\nRescored %s of %s documents in %1.3f sec: %s' % \
+                        (len(changed_doc_ids), len(incremental_scorer.doc_hashes),
+                        time.time() - start_time, ' '.join(changed_doc_ids[:10]) +
+                        (' ...' if len(changed_doc_ids) > 10 else ''))
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()